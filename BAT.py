@@ -22,15 +22,25 @@ from PyQt5.QtCore import *
 
 from datetime import datetime
 import threading
-import glob
-import shutil
 import time
 import platform
 import copy
+import multiprocessing
 
-from scripts import record, sma, excel, mfcc, item, mix
+from scripts import item, timing, startup, store, scheduler
 import scripts.fisher_yates_shuffle as fys
 
+# 解析・描画・録音は重いので最初に使うときに読み込む（タイトル画面の後に裏で読み込んでおく）
+record = startup.lazyImport("scripts.record")
+analyze = startup.lazyImport("scripts.analyze")
+stream = startup.lazyImport("scripts.stream")
+
+
+def bundledModules():
+
+    # 呼び出さない。auto-py-to-exe（PyInstaller）は文字列のimportを追えないので、遅延importするモジュールをここで参照して実行ファイルに含める
+    from scripts import record, analyze, stream
+
 APPLICATION_NAME = "BAT"
 VERSION_NUMBER = "0.9.6"
 
@@ -79,10 +89,18 @@ STAR_SIZE_RATIO = 1.8
 
 PROGRESS_LIMIT = 100
 
-MIN_NOISE_LEVEL = 25.0
-MFCC_THRESHOLD = 2
-SMA_WINDOW_SIZE = 100
-SMA_THRESHOLD_RATE = 0.1
+# テストの予定（FRAME_RATEの画面でのフレーム数）
+FRAME_RATE = 60
+START_FRAMES = 300
+PRE_WAIT_FRAMES = 180
+END_FRAMES = 300
+
+# 1項目の長さと、項目の中で表示を変えるフレーム
+ITEM_FRAMES = {"Test1": 211, "Test2": 301, "Test3": 211}
+TEST1_HIDE_FRAME = 120
+TEST2_FADE_FRAMES = 30
+TEST2_RESET_FRAME = 210
+TEST3_HIDE_FRAME = 30
 
 DEFAULT_USER_NAME = "Test"
 
@@ -309,6 +327,9 @@ class RecordingThread(QThread):
 
 class TestScene(QGraphicsScene):
 
+    # 録音中に検出した発話の開始・終了時刻 (wavPath, (startTime, endTime, interval), isFinal)
+    onsetDetected = pyqtSignal(str, object, bool)
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
@@ -321,20 +342,36 @@ class TestScene(QGraphicsScene):
         self.name = "TestScene"
         self.mode = ""
 
+        # 表示の時間はタイマーの回数ではなくschedulerの予定時刻で決める（タイマーは予定を確かめるだけ）
+        self.scheduler = scheduler.Scheduler()
+
         self.timer = QTimer()
+        self.timer.setTimerType(Qt.PreciseTimer)
         self.timer.timeout.connect(self.update)
-        self.timer.setInterval(int(1 / 60 * 1000))
+        self.timer.setInterval(int(1 / FRAME_RATE * 1000))
 
         self.logDir = ""
         self.wavPath = ""
 
         self.recTime = 0.0
+        self.recStartTime = 0.0
         self.recordThread = RecordingThread()
         self.recordThread.recordSignal.connect(self.thread)
 
+        # テストの間ずっと開いておく録音
+        self.captureService = None
+        self.recordingThread = None
+
+        # 刺激を実際に描いた時刻（time.perf_counter()） {wavPath: 時刻}
+        self.stimulusPending = None
+        self.stimulusTimes = {}
+
         self.read_indexs = []
         self.showWordIndex = 0
 
+        self.liveResults = {}
+        self.onsetDetected.connect(self.onOnsetDetected)
+
     def setLogDir(self, logDir):
 
         self.logDir = logDir
@@ -347,8 +384,43 @@ class TestScene(QGraphicsScene):
         thread = threading.Thread(target=self.record)
         thread.start()
 
+        self.recordingThread = thread
+
     def record(self):
-        record.recording(self.wavPath, self.recTime)
+
+        wavPath = self.wavPath
+        startTime = self.recStartTime
+
+        # 録音しながらCHUNKごとにSMAで発話区間を検出する
+        detector = stream.OnsetDetector(frameRate=record.RATE, thresholdRate=analyze.SMA_THRESHOLD_RATE, windowSize=analyze.SMA_WINDOW_SIZE)
+
+        def onChunk(data):
+
+            times = detector.push(stream.decodeFrames(data) ** 2)
+
+            if times is not None:
+                self.onsetDetected.emit(wavPath, times, False)
+
+        firstFrameAt = self.captureService.record(wavPath, startTime, self.recTime, callback=onChunk)
+
+        # 録音の最初のサンプルから刺激の表示までの時間を記録する（解析結果の時刻の補正に使う）
+        stimulusAt = self.stimulusTimes.get(wavPath)
+        if stimulusAt is not None:
+            store.writeAlignment(logDir=self.logDir, wavName=os.path.basename(wavPath), stimulusAt=stimulusAt, firstFrameAt=firstFrameAt)
+
+        self.onsetDetected.emit(wavPath, detector.finish(minNoiseLevel=analyze.MIN_NOISE_LEVEL), True)
+
+    def drawForeground(self, painter, rect):
+        super().drawForeground(painter, rect)
+
+        if self.stimulusPending is not None:
+            self.stimulusTimes[self.stimulusPending] = time.perf_counter()
+            self.stimulusPending = None
+
+    def onOnsetDetected(self, wavPath, times, isFinal):
+
+        if isFinal:
+            self.liveResults[os.path.normpath(wavPath)] = times
 
     def makeBaseLayer(self):
 
@@ -442,12 +514,13 @@ class TestScene(QGraphicsScene):
         self.ellipseItem.setPos(self.wordItems[ELLIPSE_POSITIONS[self.showWordIndex]].x() - ((self.ellipseItem.width() - self.wordItems[ELLIPSE_POSITIONS[self.showWordIndex]].width()) * 0.5), self.wordItems[ELLIPSE_POSITIONS[self.showWordIndex]].y() - ((self.ellipseItem.height() - self.wordItems[ELLIPSE_POSITIONS[self.showWordIndex]].height()) * 0.5))
         self.starItem.setPos(self.wordItems[STAR_POSITIONS[self.showWordIndex]].x() - ((self.starItem.width() - self.wordItems[STAR_POSITIONS[self.showWordIndex]].width()) * 0.5), self.wordItems[STAR_POSITIONS[self.showWordIndex]].y() - ((self.starItem.height() - self.wordItems[STAR_POSITIONS[self.showWordIndex]].height()) * 0.5))
 
-    def changeProcess(self):
+    def changeProcess(self, startAt=None):
 
-        if self.timer.isActive():
-            self.timer.stop()
+        # 前の段階の予定時刻から次の段階を始める（遅れを持ち越さない）
+        if startAt is None:
+            startAt = time.perf_counter()
 
-        self.scheduleTimer = 0
+        self.scheduler.clear()
         self.showWordIndex = 0
         self.showCount = 0
 
@@ -455,210 +528,225 @@ class TestScene(QGraphicsScene):
             for wordItem in self.wordItems:
                 wordItem.hide()
 
+            self.scheduler.start()
+
+            # 入力デバイスはテストの初めに一度だけ開く
+            self.captureService = record.CaptureService()
+            self.captureService.start()
+
+            self.scheduler.at(startAt + START_FRAMES / FRAME_RATE, "start", self.start)
+
         if self.process == "PreWait":
             if self.mode == "Test2":
                 for wordItem in self.wordItems:
                     wordItem.show()
 
+            self.scheduler.at(startAt + PRE_WAIT_FRAMES / FRAME_RATE, "preWait", self.preWait)
+
+        if self.process == "Test":
+            self.scheduleItem(startAt)
+
         if self.process == "End":
             for wordItem in self.wordItems:
                 wordItem.hide()
 
-        if self.process == "Result":
-            self.parent().sceneManager(mode="Result")
-        else:
-            self.timer.start()
+            self.scheduler.at(startAt + END_FRAMES / FRAME_RATE, "end", self.end)
 
-    def update(self):
+        if self.process == "Result":
 
-        if self.process == "Start":
-            self.start()
+            if self.timer.isActive():
+                self.timer.stop()
 
-        elif self.process == "PreWait":
-            self.preWait()
+            # 最後の録音が終わってからデバイスを閉じる
+            if self.recordingThread is not None:
+                self.recordingThread.join()
+            self.captureService.stop()
 
-        elif self.process == "Test":
+            # 各刺激の予定時刻と実際の時刻
+            self.scheduler.write("%s/schedule_%s.csv" % (self.logDir, self.mode.lower()))
 
-            if self.mode == "Test1":
-                self.test1()
-            elif self.mode == "Test2":
-                self.test2()
-            elif self.mode == "Test3":
-                self.test3()
+            self.parent().sceneManager(mode="Result")
 
-        elif self.process == "End":
-            self.end()
+        elif not self.timer.isActive():
+            self.timer.start()
 
-    def start(self):
+    def update(self):
+        self.scheduler.poll()
 
-        if self.scheduleTimer >= 300:
+    def wavPathOf(self, index):
+        return "%s/wavs/%s_%s_%s.wav" % (self.logDir, self.mode.lower(), "%02d" % index, READS[self.read_indexs[index]])
 
-            if self.mode == "Test2":
-                self.process = "PreWait"
-            else:
-                self.process = "Test"
-            self.changeProcess()
-        else:
-            self.scheduleTimer += 1
+    def scheduleItem(self, itemStartAt):
 
-    def preWait(self):
+        # 1項目分の予定（フレーム数はFRAME_RATEの画面での数）
+        label = os.path.basename(self.wavPathOf(self.showWordIndex))
 
-        if self.scheduleTimer >= 180:
+        def frameAt(frame):
+            return itemStartAt + frame / FRAME_RATE
 
-            self.process = "Test"
-            self.changeProcess()
-        else:
-            self.scheduleTimer += 1
+        if self.mode == "Test1":
+            self.scheduler.at(frameAt(0), "stimulus", self.test1, label=label)
+            self.scheduler.at(frameAt(TEST1_HIDE_FRAME), "hide", self.test1Hide, label=label)
 
-    def test1(self):
+        elif self.mode == "Test2":
+            self.scheduler.at(frameAt(0), "record", self.test2, label=label)
+            for frame in range(1, TEST2_FADE_FRAMES + 1):
+                self.scheduler.at(frameAt(frame), "stimulus" if frame == 1 else "fade", lambda deadline, frame=frame: self.test2Fade(frame), label=label)
+            self.scheduler.at(frameAt(TEST2_RESET_FRAME), "reset", self.test2Reset, label=label)
 
-        if self.scheduleTimer == 0:
+        elif self.mode == "Test3":
+            self.scheduler.at(frameAt(0), "stimulus", self.test3, label=label)
+            self.scheduler.at(frameAt(TEST3_HIDE_FRAME), "hide", self.test3Hide, label=label)
 
-            self.recordThread.start()
+        self.scheduler.at(frameAt(ITEM_FRAMES[self.mode]), "next", self.nextItem)
 
-            k = 0
-            for i in range(len(WORDS)):
-                for j in range(len(WORDS[i])):
+    def nextItem(self, deadline):
 
-                    if READS[self.read_indexs[self.showWordIndex]] == WORDS[i][j] and not k in EXCEPTION:
+        if self.showWordIndex >= len(self.read_indexs):
+            self.process = "End"
+            self.changeProcess(startAt=deadline)
+        else:
+            self.scheduleItem(deadline)
 
-                        self.wordItems[k].show()
-                        self.showCount = k
+    def start(self, deadline):
 
-                        self.wavPath = "%s/wavs/test1_%s_%s.wav" % (self.logDir, "%02d" % self.showWordIndex, READS[self.read_indexs[self.showWordIndex]])
-                        self.recTime = 3.5
+        if self.mode == "Test2":
+            self.process = "PreWait"
+        else:
+            self.process = "Test"
+        self.changeProcess(startAt=deadline)
 
-                        self.boxItem.setPos(self.wordItems[BOX_POSITIONS[self.read_indexs[self.showWordIndex]]].x() - ((self.boxItem.rect.width() - self.wordItems[BOX_POSITIONS[self.read_indexs[self.showWordIndex]]].width()) * 0.5), self.wordItems[BOX_POSITIONS[self.read_indexs[self.showWordIndex]]].y() - ((self.boxItem.rect.height() - self.wordItems[BOX_POSITIONS[self.read_indexs[self.showWordIndex]]].height()) * 0.5))
-                        self.ellipseItem.setPos(self.wordItems[ELLIPSE_POSITIONS[self.read_indexs[self.showWordIndex]]].x() - ((self.ellipseItem.width() - self.wordItems[ELLIPSE_POSITIONS[self.read_indexs[self.showWordIndex]]].width()) * 0.5), self.wordItems[ELLIPSE_POSITIONS[self.read_indexs[self.showWordIndex]]].y() - ((self.ellipseItem.height() - self.wordItems[ELLIPSE_POSITIONS[self.read_indexs[self.showWordIndex]]].height()) * 0.5))
-                        self.starItem.setPos(self.wordItems[STAR_POSITIONS[self.read_indexs[self.showWordIndex]]].x() - ((self.starItem.width() - self.wordItems[STAR_POSITIONS[self.read_indexs[self.showWordIndex]]].width()) * 0.5), self.wordItems[STAR_POSITIONS[self.read_indexs[self.showWordIndex]]].y() - ((self.starItem.height() - self.wordItems[STAR_POSITIONS[self.read_indexs[self.showWordIndex]]].height()) * 0.5))
+    def preWait(self, deadline):
 
-                        self.boxItem.color = Qt.black
-                        self.ellipseItem.color = Qt.black
-                        self.starItem.color = Qt.black
+        self.process = "Test"
+        self.changeProcess(startAt=deadline)
 
-                        self.boxItem.show()
-                        self.ellipseItem.show()
-                        self.starItem.show()
+    def test1(self, deadline):
 
-                        if RED_NUMBERS[self.showWordIndex] == 0:
-                            self.boxItem.color = Qt.red
+        # 録音はこの時刻から切り出す
+        self.recStartTime = time.perf_counter()
+        self.recordThread.start()
 
-                        elif RED_NUMBERS[self.showWordIndex] == 1:
-                            self.ellipseItem.color = Qt.red
+        self.wavPath = self.wavPathOf(self.showWordIndex)
+        self.recTime = 3.5
 
-                        elif RED_NUMBERS[self.showWordIndex] == 2:
-                            self.starItem.color = Qt.red
+        k = 0
+        for i in range(len(WORDS)):
+            for j in range(len(WORDS[i])):
 
-                    k += 1
+                if READS[self.read_indexs[self.showWordIndex]] == WORDS[i][j] and not k in EXCEPTION:
 
-            self.showWordIndex += 1
+                    self.wordItems[k].show()
+                    self.showCount = k
 
-        if self.scheduleTimer == 120:
+                    self.boxItem.setPos(self.wordItems[BOX_POSITIONS[self.read_indexs[self.showWordIndex]]].x() - ((self.boxItem.rect.width() - self.wordItems[BOX_POSITIONS[self.read_indexs[self.showWordIndex]]].width()) * 0.5), self.wordItems[BOX_POSITIONS[self.read_indexs[self.showWordIndex]]].y() - ((self.boxItem.rect.height() - self.wordItems[BOX_POSITIONS[self.read_indexs[self.showWordIndex]]].height()) * 0.5))
+                    self.ellipseItem.setPos(self.wordItems[ELLIPSE_POSITIONS[self.read_indexs[self.showWordIndex]]].x() - ((self.ellipseItem.width() - self.wordItems[ELLIPSE_POSITIONS[self.read_indexs[self.showWordIndex]]].width()) * 0.5), self.wordItems[ELLIPSE_POSITIONS[self.read_indexs[self.showWordIndex]]].y() - ((self.ellipseItem.height() - self.wordItems[ELLIPSE_POSITIONS[self.read_indexs[self.showWordIndex]]].height()) * 0.5))
+                    self.starItem.setPos(self.wordItems[STAR_POSITIONS[self.read_indexs[self.showWordIndex]]].x() - ((self.starItem.width() - self.wordItems[STAR_POSITIONS[self.read_indexs[self.showWordIndex]]].width()) * 0.5), self.wordItems[STAR_POSITIONS[self.read_indexs[self.showWordIndex]]].y() - ((self.starItem.height() - self.wordItems[STAR_POSITIONS[self.read_indexs[self.showWordIndex]]].height()) * 0.5))
 
-            self.wordItems[self.showCount].hide()
+                    self.boxItem.color = Qt.black
+                    self.ellipseItem.color = Qt.black
+                    self.starItem.color = Qt.black
 
-            self.boxItem.hide()
-            self.ellipseItem.hide()
-            self.starItem.hide()
+                    self.boxItem.show()
+                    self.ellipseItem.show()
+                    self.starItem.show()
 
-            self.showCount = 0
+                    if RED_NUMBERS[self.showWordIndex] == 0:
+                        self.boxItem.color = Qt.red
 
-        self.scheduleTimer += 1
+                    elif RED_NUMBERS[self.showWordIndex] == 1:
+                        self.ellipseItem.color = Qt.red
 
-        if self.scheduleTimer > 210:
+                    elif RED_NUMBERS[self.showWordIndex] == 2:
+                        self.starItem.color = Qt.red
 
-            if self.showWordIndex >= len(self.read_indexs):
-                self.process = "End"
-                self.changeProcess()
-            else:
-                self.scheduleTimer = 0
+                k += 1
 
-    def test2(self):
+        # 次に描いたときの時刻を刺激の表示時刻にする
+        self.stimulusPending = self.wavPath
 
-        if self.scheduleTimer == 0:
+        self.showWordIndex += 1
 
-            self.recordThread.start()
+    def test1Hide(self, deadline):
 
-            k = 0
-            for i in range(len(WORDS)):
-                for j in range(len(WORDS[i])):
+        self.wordItems[self.showCount].hide()
 
-                    if READS[self.read_indexs[self.showWordIndex]] == WORDS[i][j] and not k in EXCEPTION:
+        self.boxItem.hide()
+        self.ellipseItem.hide()
+        self.starItem.hide()
 
-                        self.showCount = k
-                        self.wavPath = "%s/wavs/test2_%s_%s.wav" % (self.logDir, "%02d" % self.showWordIndex, READS[self.read_indexs[self.showWordIndex]])
-                        self.recTime = 5.0
+        self.showCount = 0
 
-                    k += 1
+    def test2(self, deadline):
 
-            self.showWordIndex += 1
+        # 録音はこの時刻から切り出す
+        self.recStartTime = time.perf_counter()
+        self.recordThread.start()
 
-        if self.scheduleTimer > 0 and self.scheduleTimer <= 30:
+        self.wavPath = self.wavPathOf(self.showWordIndex)
+        self.recTime = 5.0
 
-            redValue = int(8 * self.scheduleTimer + 15)
-            self.wordItems[self.showCount].setPen(QPen(QColor(redValue, 0, 0, 255), 1.0))
-            self.wordItems[self.showCount].setBrush(QColor(redValue, 0, 0, 255))
+        k = 0
+        for i in range(len(WORDS)):
+            for j in range(len(WORDS[i])):
 
-        if self.scheduleTimer == 210:
+                if READS[self.read_indexs[self.showWordIndex]] == WORDS[i][j] and not k in EXCEPTION:
+                    self.showCount = k
 
-            self.wordItems[self.showCount].setPen(QPen(Qt.black, 1.0))
-            self.wordItems[self.showCount].setBrush(Qt.black)
-            self.showCount = 0
+                k += 1
 
-        self.scheduleTimer += 1
+        self.showWordIndex += 1
 
-        if self.scheduleTimer > 300:
+    def test2Fade(self, frame):
 
-            if self.showWordIndex >= len(self.read_indexs):
-                self.process = "End"
-                self.changeProcess()
-            else:
-                self.scheduleTimer = 0
+        # 色が変わり始めたときを刺激の表示時刻にする
+        if frame == 1:
+            self.stimulusPending = self.wavPath
 
-    def test3(self):
+        redValue = int(8 * frame + 15)
+        self.wordItems[self.showCount].setPen(QPen(QColor(redValue, 0, 0, 255), 1.0))
+        self.wordItems[self.showCount].setBrush(QColor(redValue, 0, 0, 255))
 
-        if self.scheduleTimer == 0:
+    def test2Reset(self, deadline):
 
-            self.recordThread.start()
+        self.wordItems[self.showCount].setPen(QPen(Qt.black, 1.0))
+        self.wordItems[self.showCount].setBrush(Qt.black)
+        self.showCount = 0
 
-            k = 0
-            for i in range(len(WORDS)):
-                for j in range(len(WORDS[i])):
+    def test3(self, deadline):
 
-                    if READS[self.read_indexs[self.showWordIndex]] == WORDS[i][j] and not k in EXCEPTION:
+        # 録音はこの時刻から切り出す
+        self.recStartTime = time.perf_counter()
+        self.recordThread.start()
 
-                        self.wordItems[k].show()
-                        self.showCount = k
+        self.wavPath = self.wavPathOf(self.showWordIndex)
+        self.recTime = 3.5
 
-                        self.wavPath = "%s/wavs/test3_%s_%s.wav" % (self.logDir, "%02d" % self.showWordIndex, READS[self.read_indexs[self.showWordIndex]])
-                        self.recTime = 3.5
+        k = 0
+        for i in range(len(WORDS)):
+            for j in range(len(WORDS[i])):
 
-                    k += 1
+                if READS[self.read_indexs[self.showWordIndex]] == WORDS[i][j] and not k in EXCEPTION:
 
-            self.showWordIndex += 1
+                    self.wordItems[k].show()
+                    self.showCount = k
 
-        if self.scheduleTimer == 30:
+                k += 1
 
-            self.wordItems[self.showCount].hide()
-            self.showCount = 0
+        # 次に描いたときの時刻を刺激の表示時刻にする
+        self.stimulusPending = self.wavPath
 
-        self.scheduleTimer += 1
+        self.showWordIndex += 1
 
-        if self.scheduleTimer > 210:
+    def test3Hide(self, deadline):
 
-            if self.showWordIndex >= len(self.read_indexs):
-                self.process = "End"
-                self.changeProcess()
-            else:
-                self.scheduleTimer = 0
+        self.wordItems[self.showCount].hide()
+        self.showCount = 0
 
-    def end(self):
+    def end(self, deadline):
 
-        if self.scheduleTimer >= 300:
-            self.process = "Result"
-            self.changeProcess()
-        else:
-            self.scheduleTimer += 1
+        self.process = "Result"
+        self.changeProcess(startAt=deadline)
 
 
 class ResultScene(QGraphicsScene):
@@ -675,9 +763,9 @@ class ResultScene(QGraphicsScene):
         self.titleLabel.setBrush(Qt.black)
         self.addItem(self.titleLabel)
 
-    def setParam(self, logDir, analyzeMethod, isMakeFig, mode):
+    def setParam(self, logDir, analyzeMethod, isMakeFig, mode, liveResults=None):
 
-        self.analyzeThread = AnalyzeThread(logDir=logDir, analyzeMethod=analyzeMethod, isMakeFig=isMakeFig, mode=mode, parent=self)
+        self.analyzeThread = AnalyzeThread(logDir=logDir, analyzeMethod=analyzeMethod, isMakeFig=isMakeFig, mode=mode, liveResults=liveResults, parent=self)
         self.analyzeThread.countChanged.connect(self.parent().onCountChanged)
         self.analyzeThread.finished.connect(self.analyzeFinish)
 
@@ -708,103 +796,75 @@ class AnalyzeThread(QThread):
     """
     countChanged = pyqtSignal(int)
 
-    def __init__(self, logDir, analyzeMethod, isMakeFig, mode, parent=None):
+    def __init__(self, logDir, analyzeMethod, isMakeFig, mode, liveResults=None, parent=None):
         super().__init__(parent)
 
         self.logDir = logDir
         self.analyzeMethod = analyzeMethod
         self.isMakeFig = isMakeFig
         self.mode = mode
+        self.liveResults = liveResults or {}
 
     def run(self):
 
-        test1Datas = []
-        test2Datas = []
-        test3Datas = []
-
-        testDatas = {"test1": test1Datas, "test2": test2Datas, "test3": test3Datas}
-        cellRecordPosition = {"test1": [3, 2], "test2": [3, 7], "test3": [3, 12]}
-        analyzeMethodCell = {"test1": "D35", "test2": "I35", "test3": "N35"}
-        readsPosition = {"test1": [3, 1], "test2": [3, 6], "test3": [3, 11]}
-
         distinationPath = "%s/result.xlsx" % self.logDir
         dataPath = resource_path("./data/result_template.xlsx")
 
-        if not os.path.isfile(distinationPath):
-            shutil.copy(dataPath, distinationPath)
-
-        progressCount = 0
         progressDeff = int(PROGRESS_LIMIT / (len(self.parent().read_indexs) + 1))
 
         wavDirPath = "%s/wavs" % self.logDir
         if os.path.isdir(wavDirPath):
 
-            wavPaths = glob.glob("%s/*.wav" % wavDirPath)
-            for wavPath in wavPaths:
-
-                root, ext = os.path.splitext(wavPath)
-                baseName = os.path.basename(root)
-
-                if self.mode.lower() in baseName:
-                    print("Analyzing %s.wav" % baseName)
-
-                    if self.isMakeFig:
-                        figDir = "%s/figs" % self.logDir
-                        if not os.path.isdir(figDir):
-                            os.mkdir(figDir)
-
-                    if self.analyzeMethod == "MFCC":
-
-                        if self.isMakeFig:
-                            figName = "%s/%s_mfcc.png" % (figDir, baseName)
-                        else:
-                            figName = ""
-
-                        startTime, endTime, interval = mfcc.run(fileName=wavPath, figName=figName, vadThreshold=MFCC_THRESHOLD)
-                        excel.over_write_one_value(filePath=distinationPath, sheetName="Simple Tabulation", value="MFCC", cell=analyzeMethodCell[self.mode.lower()])
-
-                    if self.analyzeMethod == "SMA":
+            # 出題順に並んだ録音ファイル
+            wavPaths = analyze.listWavPaths(wavDirPath=wavDirPath, mode=self.mode)
+            figNames = analyze.makeFigNames(logDir=self.logDir, wavPaths=wavPaths, analyzeMethod=self.analyzeMethod, isMakeFig=self.isMakeFig)
 
-                        if self.isMakeFig:
-                            figName = "%s/%s_sma.png" % (figDir, baseName)
-                        else:
-                            figName = ""
+            params = analyze.makeParams(minNoiseLevel=analyze.MIN_NOISE_LEVEL, mfccThreshold=analyze.MFCC_THRESHOLD, smaWindowSize=analyze.SMA_WINDOW_SIZE, smaThresholdRate=analyze.SMA_THRESHOLD_RATE)
 
-                        startTime, endTime, interval = sma.run(fileName=wavPath, figName=figName, windowSize=SMA_WINDOW_SIZE, thresholdRate=SMA_THRESHOLD_RATE, minNoiseLevel=MIN_NOISE_LEVEL)
-                        excel.over_write_one_value(filePath=distinationPath, sheetName="Simple Tabulation", value="SMA", cell=analyzeMethodCell[self.mode.lower()])
+            # 段階ごとの処理時間を計測する場合
+            profiler = timing.Profiler() if params["profile"] else None
 
-                    if self.analyzeMethod == "Mix":
+            # SMAは録音中に検出済みの結果をそのまま使う
+            if self.analyzeMethod == "SMA" and not self.isMakeFig and all(os.path.normpath(wavPath) in self.liveResults for wavPath in wavPaths):
+                results = [self.liveResults[os.path.normpath(wavPath)] for wavPath in wavPaths]
 
-                        if self.isMakeFig:
-                            figName = "%s/%s_mix.png" % (figDir, baseName)
-                        else:
-                            figName = ""
-
-                        startTime, endTime, interval = mix.run(fileName=wavPath, figName=figName, smaWindowSize=SMA_WINDOW_SIZE, smaThresholdRate=SMA_THRESHOLD_RATE, minNoiseLevel=MIN_NOISE_LEVEL)
-                        excel.over_write_one_value(filePath=distinationPath, sheetName="Simple Tabulation", value="Mix", cell=analyzeMethodCell[self.mode.lower()])
-
-                    datas = [startTime, endTime, interval]
-                    testDatas[self.mode.lower()].append(datas)
+            # 各ファイルの解析をプロセスプールで並列に実行する
+            else:
+                results = analyze.analyzeFiles(analyzeMethod=self.analyzeMethod, fileNames=wavPaths, figNames=figNames, params=params, progress=lambda doneCount: self.countChanged.emit(progressDeff * doneCount), profiler=profiler)
 
-                    progressCount += progressDeff
-                    self.countChanged.emit(progressCount)
+            # 刺激の表示からの時刻にする
+            if params["alignToStimulus"]:
+                results = analyze.alignResults(fileNames=wavPaths, results=results)
 
             reads = []
             for index in self.parent().read_indexs:
                 reads.append(READS[index])
 
-            excel.over_write_list_1d(filePath=distinationPath, sheetName="Simple Tabulation", l_1d=reads, start_row=readsPosition[self.mode.lower()][0], start_col=readsPosition[self.mode.lower()][1])
-            excel.over_write_list_2d(filePath=distinationPath, sheetName="Simple Tabulation", l_2d=testDatas[self.mode.lower()], start_row=cellRecordPosition[self.mode.lower()][0], start_col=cellRecordPosition[self.mode.lower()][1])
+            with timing.profiling(profiler, fileName=distinationPath):
+                analyze.writeSessionResult(filePath=distinationPath, templatePath=dataPath, mode=self.mode, analyzeMethod=self.analyzeMethod, reads=reads, results=results)
+                analyze.writeSessionStore(logDir=self.logDir, mode=self.mode, analyzeMethod=self.analyzeMethod, wavPaths=wavPaths, results=results, params=params)
 
-            progressCount = PROGRESS_LIMIT
-            self.countChanged.emit(progressCount)
+            if profiler is not None:
+                analyze.writeTimingReport(logDir=self.logDir, mode=self.mode, records=profiler.records)
+
+        # 録音が無くても空のresult.xlsxを作る
+        elif not os.path.isfile(distinationPath):
+            analyze.writeSessionResult(filePath=distinationPath, templatePath=dataPath, mode=self.mode, analyzeMethod=self.analyzeMethod, reads=[], results=[])
+
+        progressCount = PROGRESS_LIMIT
+        self.countChanged.emit(progressCount)
 
 
 class MainWindow(QMainWindow):
 
+    # 裏での読み込みに失敗したモジュール（別のスレッドから送る）
+    moduleLoadFailed = pyqtSignal(str)
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
+        self.moduleLoadFailed.connect(self.onModuleLoadFailed)
+
         self.setWindowIcon(QIcon(resource_path("./data/Thesquid.ink-Free-Flat-Sample-Support.ico")))
 
         self.dirName = ""
@@ -849,6 +909,9 @@ class MainWindow(QMainWindow):
         self.firstTitle = True
         self.sceneManager(mode="Title")
 
+    def onModuleLoadFailed(self, message):
+        QMessageBox.critical(self, "Startup error", "Could not load the recording / analysis modules !\n%s" % message, QMessageBox.Ok)
+
     def initLogDir(self):
 
         datatime = datetime.now().strftime("%Y.%m.%d_%H.%M.%S") # .strftime("%Y/%m/%d %H:%M:%S")
@@ -877,7 +940,7 @@ class MainWindow(QMainWindow):
 
             resultScene.setPosAndSize(frameSize=self.geometry().size())
             resultScene.read_indexs = self.read_indexs
-            resultScene.setParam(logDir=self.logDir, analyzeMethod=self.analyzeMethod, isMakeFig=self.isMakeFig, mode=self.testScene.mode)
+            resultScene.setParam(logDir=self.logDir, analyzeMethod=self.analyzeMethod, isMakeFig=self.isMakeFig, mode=self.testScene.mode, liveResults=self.testScene.liveResults)
             self.graphicView.setScene(resultScene)
 
             self.progress.setGeometry(int((self.width() - self.progress.width()) * 0.52), int((self.height() - self.progress.height()) * 0.6), self.progress.width(), self.progress.height())
@@ -1097,9 +1160,19 @@ class InputDialog(QDialog):
 
 if __name__ == "__main__":
 
+    # 実行ファイル化したときに解析用の子プロセスが再びGUIを起動しないようにする
+    multiprocessing.freeze_support()
+
+    # 実行ファイルに遅延importするモジュールが含まれているかの確認
+    if "--check-modules" in sys.argv:
+        sys.exit(0 if startup.checkModules() else 1)
+
     app = QApplication(sys.argv)
     mainWindow = MainWindow()
     # mainWindow.show()
 
+    # 画面が出てから解析・録音のモジュールを裏で読み込む（読み込めなければその時点で知らせる）
+    QTimer.singleShot(0, lambda: startup.warmUp(onError=lambda name, e: mainWindow.moduleLoadFailed.emit("%s: %s" % (name, e))))
+
     mainWindow.callInputDialog()
     sys.exit(app.exec_())
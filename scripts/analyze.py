@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import re
+import glob
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from scripts import sma, mfcc, mix, excel, stream, cache, figure, timing, features, store
+
+
+MIN_NOISE_LEVEL = 25.0
+MFCC_THRESHOLD = 2
+SMA_WINDOW_SIZE = 100
+SMA_THRESHOLD_RATE = 0.1
+MIX_ENGINE = "fast"
+USE_FEATURE_CACHE = True
+
+# MFCC・Mixで特徴量をまとめて計算するファイル数（1ならファイルごとに計算する）
+MFCC_BATCH_SIZE = 16
+
+# 解析の浮動小数点の精度（"float32"にするとメモリの読み書きが約半分になる。結果の差は1サンプル以内）
+PRECISION = "float64"
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+
+# 前回と同じwav・同じパラメータのファイルは解析せず、セッションのresults.sqliteに残した結果を使う
+INCREMENTAL = True
+
+# 解析結果に影響するパラメータ（これが変わったら解析し直す）
+RESULT_PARAMS = {
+    "SMA": ["minNoiseLevel", "smaWindowSize", "smaThresholdRate", "precision", "blockSize"],
+    "MFCC": ["mfccThreshold", "precision"],
+    "Mix": ["minNoiseLevel", "smaWindowSize", "smaThresholdRate", "mixEngine", "precision", "blockSize"],
+}
+
+# 検出の処理を変えたら上げる（前の版で記録した結果は使わずに解析し直す）
+ANALYZER_VERSION = 3
+
+# 録音の最初のサンプルから刺激を表示するまでの時間（録音時にresults.sqliteに記録）を解析結果から引き、
+# 開始・終了時刻を刺激の表示からの時刻にする
+ALIGN_TO_STIMULUS = True
+
+# 段階ごとの処理時間を計測し、セッションフォルダに timing_<mode>.csv を書く
+# "memory"にすると段階ごとのメモリのピークも測る（tracemallocを使うので遅くなる）
+PROFILE = False
+
+# 図の作り方
+#   "inline"   : 解析と同時に描く（従来どおり）
+#   "deferred" : 解析後にバックグラウンドのプロセスで描く
+#   "onDemand" : 描画用の配列（figs/*.npz）だけ保存し、python -m scripts.figure で後から描く
+FIGURE_MODE = "deferred"
+
+RESULT_SHEET_NAME = "Simple Tabulation"
+
+# result.xlsx上の各テストの書き込み位置
+CELL_RECORD_POSITION = {"test1": [3, 2], "test2": [3, 7], "test3": [3, 12]}
+ANALYZE_METHOD_CELL = {"test1": "D35", "test2": "I35", "test3": "N35"}
+READS_POSITION = {"test1": [3, 1], "test2": [3, 6], "test3": [3, 11]}
+
+# 録音ファイル名 test1_00_か.wav => (モード, 出題順, 読み)
+WAV_NAME_PATTERN = re.compile(r"^(test\d)_(\d+)_(.*)$")
+
+FIG_SUFFIXES = {"SMA": "sma", "MFCC": "mfcc", "Mix": "mix"}
+
+
+def parseWavName(wavPath):
+
+    root, ext = os.path.splitext(wavPath)
+    match = WAV_NAME_PATTERN.match(os.path.basename(root))
+
+    if match is None:
+        return None
+
+    return match.group(1), int(match.group(2)), match.group(3)
+
+def listWavPaths(wavDirPath, mode):
+
+    wavPaths = []
+
+    for wavPath in glob.glob("%s/*.wav" % wavDirPath):
+
+        wavName = parseWavName(wavPath)
+        if wavName is None or wavName[0] != mode.lower():
+            continue
+
+        wavPaths.append((wavName[1], wavPath))
+
+    # 出題順（read_indexsの順）に並べる
+    wavPaths.sort()
+
+    return [wavPath for index, wavPath in wavPaths]
+
+def readsOf(wavPaths):
+    return [parseWavName(wavPath)[2] for wavPath in wavPaths]
+
+def figNameOf(wavPath, figDir, analyzeMethod):
+
+    root, ext = os.path.splitext(wavPath)
+    baseName = os.path.basename(root)
+
+    return "%s/%s_%s.png" % (figDir, baseName, FIG_SUFFIXES[analyzeMethod])
+
+def makeFigNames(logDir, wavPaths, analyzeMethod, isMakeFig):
+
+    if not isMakeFig:
+        return [""] * len(wavPaths)
+
+    figDir = "%s/figs" % logDir
+    if not os.path.isdir(figDir):
+        os.mkdir(figDir)
+
+    return [figNameOf(wavPath=wavPath, figDir=figDir, analyzeMethod=analyzeMethod) for wavPath in wavPaths]
+
+# blockSizeを指定するとSMAとMixは逐次（ブロック単位）解析になる
+def makeParams(minNoiseLevel=MIN_NOISE_LEVEL, mfccThreshold=MFCC_THRESHOLD, smaWindowSize=SMA_WINDOW_SIZE, smaThresholdRate=SMA_THRESHOLD_RATE, mixEngine=MIX_ENGINE, useFeatureCache=USE_FEATURE_CACHE, figureMode=FIGURE_MODE, blockSize=None, precision=PRECISION, profile=PROFILE, mfccBatchSize=MFCC_BATCH_SIZE, incremental=INCREMENTAL, alignToStimulus=ALIGN_TO_STIMULUS):
+    return {"minNoiseLevel": minNoiseLevel, "mfccThreshold": mfccThreshold, "smaWindowSize": smaWindowSize, "smaThresholdRate": smaThresholdRate, "mixEngine": mixEngine, "useFeatureCache": useFeatureCache, "figureMode": figureMode, "blockSize": blockSize, "precision": precision, "profile": profile, "mfccBatchSize": mfccBatchSize, "incremental": incremental, "alignToStimulus": alignToStimulus}
+
+# precomputedは features.precompute でまとめて計算済みのMFCC特徴量
+def analyzeFile(analyzeMethod, fileName, figName, params, precomputed=None):
+
+    # MFCC特徴量はセッションのcacheフォルダに残し、閾値を変えた再解析で使い回す
+    if params.get("useFeatureCache"):
+        featureCache = cache.FeatureCache(cacheDir=cache.cacheDirOf(fileName))
+    else:
+        featureCache = None
+
+    if precomputed is not None:
+        featureCache = features.PrecomputedFeatures(precomputed, fallback=featureCache)
+
+    # 逐次解析では図を作らない
+    isStreaming = params.get("blockSize") is not None and figName == ""
+
+    dtype = PRECISIONS[params.get("precision", "float64")]
+
+    if analyzeMethod == "SMA" and isStreaming:
+        return stream.runSma(fileName=fileName, windowSize=params["smaWindowSize"], thresholdRate=params["smaThresholdRate"], minNoiseLevel=params["minNoiseLevel"], blockSize=params["blockSize"])
+
+    if analyzeMethod == "Mix" and isStreaming:
+        return stream.runMix(fileName=fileName, smaWindowSize=params["smaWindowSize"], smaThresholdRate=params["smaThresholdRate"], minNoiseLevel=params["minNoiseLevel"], engine=params["mixEngine"], blockSize=params["blockSize"])
+
+    # 図を後回しにする場合は、ここでは描かずに描画用の配列を.npzに保存するだけにする
+    isDeferred = figName != "" and params.get("figureMode", "inline") != "inline"
+    if isDeferred:
+        runFigName = ""
+    else:
+        runFigName = figName
+
+    if analyzeMethod == "MFCC":
+        result = mfcc.run(fileName=fileName, figName=runFigName, vadThreshold=params["mfccThreshold"], cache=featureCache, returnPlot=isDeferred, dtype=dtype)
+
+    elif analyzeMethod == "SMA":
+        result = sma.run(fileName=fileName, figName=runFigName, windowSize=params["smaWindowSize"], thresholdRate=params["smaThresholdRate"], minNoiseLevel=params["minNoiseLevel"], returnPlot=isDeferred, dtype=dtype)
+
+    elif analyzeMethod == "Mix":
+        result = mix.run(fileName=fileName, figName=runFigName, smaWindowSize=params["smaWindowSize"], smaThresholdRate=params["smaThresholdRate"], minNoiseLevel=params["minNoiseLevel"], engine=params["mixEngine"], cache=featureCache, returnPlot=isDeferred, dtype=dtype)
+
+    else:
+        raise ValueError("Unknown analyze method: %s" % analyzeMethod)
+
+    if isDeferred:
+        startTime, endTime, interval, plotData = result
+
+        with timing.stage("plotData"):
+            figure.savePlotData(figName=figName, kind=FIG_SUFFIXES[analyzeMethod], plotData=plotData)
+
+        return startTime, endTime, interval
+
+    return result
+
+def analyzeFileProfiled(analyzeMethod, fileName, figName, params, precomputed=None):
+
+    # ワーカープロセスで計測し、記録を結果と一緒に返す
+    profiler = timing.Profiler(traceMemory=params.get("profile") == "memory")
+
+    with timing.profiling(profiler, fileName=fileName):
+        with timing.stage("total"):
+            result = analyzeFile(analyzeMethod, fileName, figName, params, precomputed=precomputed)
+
+    return result, profiler.records
+
+def analyzeBatch(analyzeMethod, fileNames, figNames, params, isProfiled=False):
+
+    # MFCCを使う解析は、バッチ内の全ファイルの特徴量をまとめて計算してから1ファイルずつ判定する
+    precomputed = None
+    batchRecords = []
+
+    if len(fileNames) > 1 and analyzeMethod in ("MFCC", "Mix"):
+
+        profiler = timing.Profiler() if isProfiled else None
+        with timing.profiling(profiler), timing.stage("mfccBatch"):
+            precomputed = features.precompute(analyzeMethod, fileNames, dtype=PRECISIONS[params.get("precision", "float64")], useFeatureCache=params.get("useFeatureCache", False))
+
+        # まとめて計算した時間はファイル数で等分して各ファイルに付ける
+        if profiler is not None:
+            for record in profiler.records:
+                batchRecords.append(dict(record, wallTime=record["wallTime"] / len(fileNames), cpuTime=record["cpuTime"] / len(fileNames)))
+
+    results = []
+    for fileName, figName in zip(fileNames, figNames):
+
+        if isProfiled:
+            result, records = analyzeFileProfiled(analyzeMethod, fileName, figName, params, precomputed=precomputed)
+            results.append((result, [dict(record, fileName=fileName) for record in batchRecords] + records))
+        else:
+            results.append(analyzeFile(analyzeMethod, fileName, figName, params, precomputed=precomputed))
+
+    return results
+
+def batchesOf(analyzeMethod, count, params, maxWorkers):
+
+    # MFCCを使う解析は最大mfccBatchSizeファイルずつまとめる（全ワーカーに仕事が行き渡る大きさまで）
+    batchSize = 1
+    if analyzeMethod in ("MFCC", "Mix") and params.get("blockSize") is None:
+        batchSize = max(1, min(params.get("mfccBatchSize", 1), -(-count // maxWorkers)))
+
+    return [list(range(start, min(start + batchSize, count))) for start in range(0, count, batchSize)]
+
+# profilerを渡すとファイルごとの段階別の処理時間をそこに集める
+def analyzeFiles(analyzeMethod, fileNames, figNames, params, maxWorkers=None, progress=None, profiler=None):
+
+    if params.get("incremental"):
+        return analyzeStaleFiles(analyzeMethod, fileNames, figNames, params, maxWorkers=maxWorkers, progress=progress, profiler=profiler)
+
+    # 結果はfileNamesと同じ順で返す（終了順ではない）
+    results = [None] * len(fileNames)
+    isProfiled = profiler is not None
+
+    if maxWorkers is None:
+        maxWorkers = os.cpu_count() or 1
+    maxWorkers = max(1, min(maxWorkers, len(fileNames)))
+
+    batches = batchesOf(analyzeMethod, len(fileNames), params, maxWorkers)
+
+    if maxWorkers == 1:
+
+        doneCount = 0
+        for batch in batches:
+
+            batchResults = analyzeBatch(analyzeMethod, [fileNames[index] for index in batch], [figNames[index] for index in batch], params, isProfiled)
+            for index, result in zip(batch, batchResults):
+                results[index] = result
+
+            doneCount += len(batch)
+            if progress is not None:
+                progress(doneCount)
+
+    else:
+
+        with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+
+            futures = {}
+            for batch in batches:
+                future = executor.submit(analyzeBatch, analyzeMethod, [fileNames[index] for index in batch], [figNames[index] for index in batch], params, isProfiled)
+                futures[future] = batch
+
+            doneCount = 0
+            for future in as_completed(futures):
+
+                for index, result in zip(futures[future], future.result()):
+                    results[index] = result
+                doneCount += len(futures[future])
+
+                if progress is not None:
+                    progress(doneCount)
+
+    if profiler is not None:
+        for index, (result, records) in enumerate(results):
+            results[index] = result
+            profiler.extend(records)
+
+    # 解析結果は先に返し、図はバックグラウンドで描く
+    if params.get("figureMode") == "deferred":
+        renderFigures(figNames=figNames)
+
+    return results
+
+def sessionDirOf(fileName):
+
+    # <session>/wavs/xxx.wav => <session>
+    return os.path.dirname(os.path.dirname(os.path.abspath(fileName)))
+
+def resultParamsOf(analyzeMethod, params):
+
+    resultParams = {key: params.get(key) for key in RESULT_PARAMS[analyzeMethod]}
+    resultParams["analyzerVersion"] = ANALYZER_VERSION
+
+    return json.dumps(resultParams, sort_keys=True)
+
+def hasFigure(figName):
+    return os.path.isfile(figName) or os.path.isfile(figure.plotDataPathOf(figName))
+
+def analyzeStaleFiles(analyzeMethod, fileNames, figNames, params, maxWorkers=None, progress=None, profiler=None):
+
+    # マニフェストと比べて、新しいファイル・変わったファイル・パラメータが変わったファイルだけ解析する
+    paramsText = resultParamsOf(analyzeMethod, params)
+
+    results = [None] * len(fileNames)
+    manifests = {}
+    entries = [None] * len(fileNames)
+    staleIndexs = []
+
+    for index, (fileName, figName) in enumerate(zip(fileNames, figNames)):
+
+        logDir = sessionDirOf(fileName)
+        if logDir not in manifests:
+            manifests[logDir] = store.readManifest(logDir, analyzeMethod)
+
+        stat = os.stat(fileName)
+        wavName = os.path.basename(fileName)
+        recorded = manifests[logDir].get(wavName)
+
+        entry = {"wavName": wavName, "size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": None, "params": paramsText}
+        entries[index] = entry
+
+        isFresh = recorded is not None and recorded["params"] == paramsText and (figName == "" or hasFigure(figName))
+
+        if isFresh and (recorded["size"], recorded["mtime"]) == (entry["size"], entry["mtime"]):
+            entry["hash"] = recorded["hash"]
+        else:
+            # サイズや更新時刻が変わっていれば中身で比べる（コピーしただけなら解析し直さない）
+            entry["hash"] = cache.fileHash(fileName)
+            isFresh = isFresh and recorded["hash"] == entry["hash"]
+
+        if isFresh:
+            results[index] = (recorded["startTime"], recorded["endTime"], recorded["interval"])
+        else:
+            staleIndexs.append(index)
+
+    freshCount = len(fileNames) - len(staleIndexs)
+    if progress is not None and freshCount > 0:
+        progress(freshCount)
+
+    if len(staleIndexs) > 0:
+
+        staleResults = analyzeFiles(analyzeMethod, [fileNames[index] for index in staleIndexs], [figNames[index] for index in staleIndexs], dict(params, incremental=False),
+                                    maxWorkers=maxWorkers, progress=None if progress is None else (lambda doneCount: progress(freshCount + doneCount)), profiler=profiler)
+
+        for index, result in zip(staleIndexs, staleResults):
+            results[index] = result
+
+    # 更新時刻だけ変わったものも含めて書き直す
+    entriesByDir = {}
+    for fileName, entry, result in zip(fileNames, entries, results):
+        entriesByDir.setdefault(sessionDirOf(fileName), []).append(dict(entry, result=result))
+
+    for logDir, dirEntries in entriesByDir.items():
+        store.writeManifest(logDir, analyzeMethod, dirEntries)
+
+    return results
+
+def alignResults(fileNames, results):
+
+    # 刺激の表示時刻が記録されていないファイル（古いセッションなど）と"Input Low"はそのまま
+    offsets = {}
+    aligned = []
+
+    for fileName, result in zip(fileNames, results):
+
+        logDir = sessionDirOf(fileName)
+        if logDir not in offsets:
+            offsets[logDir] = store.readAlignment(logDir)
+
+        offset = offsets[logDir].get(os.path.basename(fileName))
+
+        if offset is None or "Input Low" in result:
+            aligned.append(result)
+            continue
+
+        startTime, endTime, interval = result
+        aligned.append((startTime - offset, endTime - offset, interval))
+
+    return aligned
+
+def renderFigures(figNames, maxWorkers=None):
+
+    paths = [figure.plotDataPathOf(figName) for figName in figNames if figName != ""]
+    if len(paths) == 0:
+        return None
+
+    renderer = figure.FigureRenderer(maxWorkers=maxWorkers)
+    renderer.submit(paths, removePlotData=True)
+    renderer.shutdown(wait=False)
+
+    return renderer
+
+def writeSessionResult(filePath, templatePath, mode, analyzeMethod, reads, results):
+
+    mode = mode.lower()
+    testDatas = [[startTime, endTime, interval] for startTime, endTime, interval in results]
+
+    # result.xlsxは一度だけ開き、最後にまとめて保存する
+    with timing.stage("excel"), excel.WorkbookWriter(filePath=filePath, templatePath=templatePath) as writer:
+
+        if len(results) > 0:
+            writer.write_one_value(sheetName=RESULT_SHEET_NAME, value=analyzeMethod, cell=ANALYZE_METHOD_CELL[mode])
+
+        writer.write_list_1d(sheetName=RESULT_SHEET_NAME, l_1d=reads, start_row=READS_POSITION[mode][0], start_col=READS_POSITION[mode][1])
+        writer.write_list_2d(sheetName=RESULT_SHEET_NAME, l_2d=testDatas, start_row=CELL_RECORD_POSITION[mode][0], start_col=CELL_RECORD_POSITION[mode][1])
+
+def writeSessionStore(logDir, mode, analyzeMethod, wavPaths, results, params=None):
+
+    # result.xlsxと同じ結果をセッションのresults.sqliteにも書く（全セッションの検索用）
+    items = [parseWavName(wavPath)[1:] for wavPath in wavPaths]
+    store.writeSession(logDir=logDir, mode=mode, analyzeMethod=analyzeMethod, items=items, results=results, params=params)
+
+def timingReportPathOf(logDir, mode):
+    return "%s/timing_%s.csv" % (logDir, mode.lower())
+
+def writeTimingReport(logDir, mode, records):
+
+    # result.xlsxの隣に置く（全セッションの集計は python -m scripts.timing <logRoot>）
+    filePath = timingReportPathOf(logDir, mode)
+    timing.Profiler().write(filePath, records=records)
+
+    return filePath
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# wavの読み込み
+# PCMデータをメモリマップし、int16のままコピーせずに参照する。floatへの変換は必要になった時に一度だけ行う。
+
+import struct
+
+import numpy as np
+
+
+FULL_SCALE = float(2 ** 15)
+
+# 旧ReadWavFileの割る数（2 ^ 15 はXORで13になる）
+# MIN_NOISE_LEVELなどの閾値はこのスケールの平均音量で調整されているので、解析側はこの値を使い続ける
+LEGACY_SCALE = float((2 ^ 15))
+
+
+class WavFile:
+
+    def __init__(self, fileName):
+
+        self.fileName = fileName
+
+        with open(fileName, "rb") as f:
+            offset, size, fmt = self.parseChunks(f)
+
+        formatTag, self.nChannels, self.frameRate, byteRate, blockAlign, bitsPerSample = fmt
+
+        if formatTag != 1 or bitsPerSample != 16:
+            raise ValueError("Unsupported wav format (16bit PCM only): %s" % fileName)
+
+        self.nFrames = size // blockAlign
+        nSamples = self.nFrames * self.nChannels
+
+        # チャンネルはインターリーブのまま（旧ReadWavFileと同じく1次元）
+        if nSamples == 0:
+            self.pcm = np.zeros(0, dtype="<i2")
+        else:
+            self.pcm = np.memmap(fileName, dtype="<i2", mode="r", offset=offset, shape=(nSamples,))
+
+        self.converted = {}
+
+    @staticmethod
+    def parseChunks(f):
+
+        riff, riffSize, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError("Not a wav file")
+
+        fmt = None
+
+        while True:
+
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError("No data chunk")
+
+            chunkId, chunkSize = struct.unpack("<4sI", header)
+
+            if chunkId == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(chunkSize - 16, 1)
+            elif chunkId == b"data":
+                if fmt is None:
+                    raise ValueError("No fmt chunk before data")
+
+                # 録音中断などでサイズが実際より大きい場合はファイル末尾まで
+                offset = f.tell()
+                f.seek(0, 2)
+                return offset, min(chunkSize, f.tell() - offset), fmt
+            else:
+                f.seek(chunkSize, 1)
+
+            # チャンクは2バイト境界に揃えられている
+            if chunkSize % 2 == 1:
+                f.seek(1, 1)
+
+    def samples(self, dtype=np.float32, scale=FULL_SCALE):
+
+        # 変換結果は (dtype, scale) ごとに一度だけ作る
+        key = (np.dtype(dtype).str, scale)
+
+        if key not in self.converted:
+            x = np.array(self.pcm, dtype=dtype)
+            x /= np.dtype(dtype).type(scale)
+            self.converted[key] = x
+
+        return self.converted[key]
+
+    def blocks(self, blockSize, dtype=np.float32, scale=FULL_SCALE):
+
+        # メモリマップから少しずつ変換する（ファイル全体は変換しない）
+        for start in range(0, len(self.pcm), blockSize):
+            yield np.array(self.pcm[start:start + blockSize], dtype=dtype) / np.dtype(dtype).type(scale)
+
+    def close(self):
+
+        # Windowsではマップ中のファイルを移動・削除できないので明示的に外せるようにする
+        self.pcm = None
+        self.converted = {}
+
+
+def readWav(fileName, dtype=np.float64, scale=LEGACY_SCALE):
+
+    wav = WavFile(fileName)
+    return wav.samples(dtype=dtype, scale=scale), wav.frameRate
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# 移動平均
+# np.convolve(datas, np.ones(window) / window, mode="same") と同じ値を累積和から求める（窓幅によらずO(n)）
+
+import numpy as np
+
+
+# float32の入力で累積和を取るブロックのサンプル数
+BLOCK_SIZE = 2**16
+
+
+def outputTypeOf(datas):
+
+    # float32の入力はfloat32で返す（累積和は桁落ちを避けるためfloat64で取る）
+    return np.result_type(datas.dtype, np.float32)
+
+
+class RunningSum:
+
+    # 累積和を一度だけ計算し、いくつもの窓幅の移動平均に使い回す
+    def __init__(self, datas):
+
+        self.datas = np.asarray(datas)
+        self.length = len(self.datas)
+
+        # float32の入力では全長のfloat64の配列を作らず、累積和はブロックごとに取る
+        if outputTypeOf(self.datas) != np.float64:
+            self.csum = None
+            return
+
+        self.csum = np.empty(self.length + 1)
+        self.csum[0] = 0.0
+        np.cumsum(self.datas, dtype=np.float64, out=self.csum[1:])
+
+    def average(self, window):
+
+        n = self.length
+        dtype = outputTypeOf(self.datas)
+
+        # 窓の方が長いとnp.convolveは出力の長さが変わるので、そのまま畳み込む
+        if window > n:
+            return np.convolve(self.datas, np.ones(window, dtype=dtype) / window, mode="same")
+
+        delay = (window - 1) // 2
+        lead = window - 1 - delay
+
+        if self.csum is None:
+            return self.averageByBlocks(window, delay, lead, dtype)
+
+        # i番目の出力は datas[i - lead] から datas[i + delay] まで（範囲外は0）の平均
+        # 累積和の差を一つの出力の配列に直接書く（先頭・中間・末尾で範囲外の側が変わる）
+        csum = self.csum
+        smas = np.empty(n, dtype=dtype)
+
+        smas[:lead] = csum[delay + 1:window]
+        np.subtract(csum[window:], csum[:n - window + 1], out=smas[lead:n - delay])
+        np.subtract(csum[n], csum[n - window + 1:n - lead], out=smas[n - delay:])
+
+        smas /= dtype.type(window)
+
+        return smas
+
+    def averageByBlocks(self, window, delay, lead, dtype):
+
+        # 出力のブロックごとに、datas[start - lead] から datas[end - 1 + delay] まで（範囲外は0）の累積和をfloat64で取る
+        n = self.length
+        smas = np.empty(n, dtype=dtype)
+        csum = np.empty(BLOCK_SIZE + window)
+
+        for start in range(0, n, BLOCK_SIZE):
+
+            end = min(n, start + BLOCK_SIZE)
+            size = end - start
+
+            lo = max(0, start - lead)
+            hi = min(n, end + delay)
+
+            local = csum[:size + window]
+            local[:] = 0.0
+            local[1 + lo - (start - lead):1 + hi - (start - lead)] = self.datas[lo:hi]
+            np.cumsum(local, out=local)
+
+            np.subtract(local[window:], local[:size], out=smas[start:end])
+
+        smas /= dtype.type(window)
+
+        return smas
+
+
+def movingAverage(datas, window):
+    return RunningSum(datas).average(window)
+
+
+class MovingAverage:
+
+    # movingAverageと同じ値を逐次に出す
+    # 出力は (window - 1) // 2 サンプル遅れて確定する
+    def __init__(self, window):
+
+        self.window = window
+        self.delay = (window - 1) // 2
+
+        self.history = np.zeros(window) # 直前のwindowサンプル（先頭より前は0）
+        self.skip = self.delay
+
+    def push(self, datas):
+
+        ext = np.concatenate((self.history, datas))
+        csum = np.concatenate(([0.0], np.cumsum(ext)))
+
+        # 新しい各サンプルで終わる窓の合計
+        smas = (csum[self.window + 1:] - csum[1:len(datas) + 1]) / self.window
+        self.history = ext[-self.window:]
+
+        # 信号の先頭より前を中心とする窓は捨てる
+        if self.skip > 0:
+            skip = min(self.skip, len(smas))
+            smas = smas[skip:]
+            self.skip -= skip
+
+        return smas
+
+    def flush(self):
+
+        # 末尾の遅延分を0詰めで確定させる
+        return self.push(np.zeros(self.delay))
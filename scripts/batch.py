@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# GUIを使わずにログフォルダ以下の全セッションを再解析する
+# python -m scripts.batch ~/Documents/log --method Mix
+
+import os
+import csv
+import glob
+import argparse
+
+from scripts import analyze, timing, store
+
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "result_template.xlsx")
+
+MODES = ["Test1", "Test2", "Test3"]
+
+SUMMARY_HEADER = ["session", "version", "user", "date", "mode", "index", "read", "method", "startTime", "endTime", "interval"]
+
+
+def findSessions(logRoot):
+
+    sessions = []
+
+    for logDir in sorted(glob.glob("%s/**/BAT_Ver*" % logRoot, recursive=True)):
+
+        info = store.parseSessionName(logDir)
+        if info is None or not os.path.isdir("%s/wavs" % logDir):
+            continue
+
+        sessions.append((logDir, info))
+
+    return sessions
+
+def run(logRoot, analyzeMethod, params, modes=MODES, isMakeFig=False, maxWorkers=None, summaryPath=None):
+
+    sessions = findSessions(logRoot)
+
+    # 全セッションの全ファイルを一つのプロセスプールに流す
+    jobs = []
+    fileNames = []
+    figNames = []
+
+    for logDir, info in sessions:
+        for mode in modes:
+
+            wavPaths = analyze.listWavPaths(wavDirPath="%s/wavs" % logDir, mode=mode)
+            if len(wavPaths) == 0:
+                continue
+
+            jobs.append((logDir, info, mode, wavPaths))
+            fileNames.extend(wavPaths)
+            figNames.extend(analyze.makeFigNames(logDir=logDir, wavPaths=wavPaths, analyzeMethod=analyzeMethod, isMakeFig=isMakeFig))
+
+    print("Analyzing %d files in %d sessions" % (len(fileNames), len(sessions)))
+
+    profiler = timing.Profiler() if params.get("profile") else None
+    results = analyze.analyzeFiles(analyzeMethod=analyzeMethod, fileNames=fileNames, figNames=figNames, params=params, maxWorkers=maxWorkers, profiler=profiler)
+
+    if params.get("alignToStimulus"):
+        results = analyze.alignResults(fileNames, results)
+
+    # 計測結果はセッション・モードごとに分けて書く
+    recordsByFile = {}
+    if profiler is not None:
+        for record in profiler.records:
+            recordsByFile.setdefault(record["fileName"], []).append(record)
+
+    allRecords = []
+
+    if summaryPath is None:
+        summaryPath = "%s/summary.csv" % logRoot
+
+    # Excelで文字化けしないようにBOM付きで書き出す
+    with open(summaryPath, "w", newline="", encoding="utf-8-sig") as f:
+
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_HEADER)
+
+        offset = 0
+        for logDir, info, mode, wavPaths in jobs:
+
+            sessionResults = results[offset:offset + len(wavPaths)]
+            offset += len(wavPaths)
+
+            reads = analyze.readsOf(wavPaths)
+
+            sessionProfiler = None
+            if profiler is not None:
+                sessionProfiler = timing.Profiler()
+                for wavPath in wavPaths:
+                    sessionProfiler.extend(recordsByFile.get(wavPath, []))
+
+            with timing.profiling(sessionProfiler, fileName="%s/result.xlsx" % logDir):
+                analyze.writeSessionResult(filePath="%s/result.xlsx" % logDir, templatePath=TEMPLATE_PATH, mode=mode, analyzeMethod=analyzeMethod, reads=reads, results=sessionResults)
+                analyze.writeSessionStore(logDir=logDir, mode=mode, analyzeMethod=analyzeMethod, wavPaths=wavPaths, results=sessionResults, params=params)
+
+            if sessionProfiler is not None:
+                analyze.writeTimingReport(logDir=logDir, mode=mode, records=sessionProfiler.records)
+                allRecords.extend(sessionProfiler.records)
+
+            for wavPath, (startTime, endTime, interval) in zip(wavPaths, sessionResults):
+
+                _, index, read = analyze.parseWavName(wavPath)
+                writer.writerow([os.path.basename(logDir), info["version"], info["user"], info["date"], mode, index, read, analyzeMethod, startTime, endTime, interval])
+
+    print("Wrote %s" % summaryPath)
+
+    if profiler is not None:
+        timing.printSummary(timing.summarize(allRecords))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Re-analyze every BAT session under a log directory.")
+    parser.add_argument("logRoot")
+    parser.add_argument("--method", default="Mix", choices=list(analyze.FIG_SUFFIXES.keys()))
+    parser.add_argument("--mode", action="append", choices=MODES, help="test to analyze (repeatable, default: all)")
+    parser.add_argument("--figure", action="store_true", help="write figures to each session's figs folder")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--summary", default=None, help="combined summary csv (default: <logRoot>/summary.csv)")
+    parser.add_argument("--min-noise-level", type=float, default=analyze.MIN_NOISE_LEVEL)
+    parser.add_argument("--mfcc-threshold", type=float, default=analyze.MFCC_THRESHOLD)
+    parser.add_argument("--sma-window-size", type=int, default=analyze.SMA_WINDOW_SIZE)
+    parser.add_argument("--sma-threshold-rate", type=float, default=analyze.SMA_THRESHOLD_RATE)
+    parser.add_argument("--mix-engine", default=analyze.MIX_ENGINE, choices=["exact", "fast", "frame"])
+    parser.add_argument("--figure-mode", default=analyze.FIGURE_MODE, choices=["inline", "deferred", "onDemand"])
+    parser.add_argument("--no-feature-cache", action="store_true", help="do not read or write the per-session MFCC cache")
+    parser.add_argument("--precision", default=analyze.PRECISION, choices=list(analyze.PRECISIONS.keys()))
+    parser.add_argument("--mfcc-batch-size", type=int, default=analyze.MFCC_BATCH_SIZE, help="files whose MFCCs are computed together (MFCC/Mix)")
+    parser.add_argument("--full", action="store_true", help="re-analyze every file even if its recorded result is up to date")
+    parser.add_argument("--no-align", action="store_true", help="report times from the first recorded sample instead of from the stimulus onset")
+    parser.add_argument("--profile", action="store_true", help="write per-stage timings to each session's timing_<mode>.csv")
+    parser.add_argument("--profile-memory", action="store_true", help="also record per-stage peak memory (slower)")
+    parser.add_argument("--block-size", type=int, default=None, help="analyze SMA/Mix in fixed-size blocks with bounded memory")
+    args = parser.parse_args()
+
+    params = analyze.makeParams(minNoiseLevel=args.min_noise_level, mfccThreshold=args.mfcc_threshold, smaWindowSize=args.sma_window_size, smaThresholdRate=args.sma_threshold_rate, mixEngine=args.mix_engine, useFeatureCache=not args.no_feature_cache, figureMode=args.figure_mode, blockSize=args.block_size, precision=args.precision, profile="memory" if args.profile_memory else args.profile, mfccBatchSize=args.mfcc_batch_size, incremental=not args.full, alignToStimulus=not args.no_align)
+
+    run(logRoot=args.logRoot, analyzeMethod=args.method, params=params, modes=args.mode or MODES, isMakeFig=args.figure, maxWorkers=args.workers, summaryPath=args.summary)
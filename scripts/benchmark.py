@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# 解析のベンチマーク
+# 発話区間が分かっている合成wav（16kHz, int16）を作り、各解析の処理時間・メモリ・検出誤差を測ってJSONに保存する
+# python -m scripts.benchmark --output bench.json
+# python -m scripts.benchmark --output new.json --compare old.json
+
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import argparse
+import platform
+import tempfile
+import datetime
+import tracemalloc
+import subprocess
+
+import numpy as np
+
+from scripts import analyze, excel
+
+
+FRAME_RATE = 16000
+LENGTHS = [2.0, 5.0, 20.0] # 秒
+SNRS = [30.0, 10.0, 0.0] # dB
+METHODS = ["SMA", "MFCC", "Mix"]
+
+# 比較でこれ以上遅くなったら回帰とみなす割合
+REGRESSION_TOLERANCE = 0.2
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "result_template.xlsx")
+
+
+def makeSpeech(length, rng):
+
+    # 母音のような調波音を4Hz程度（モーラの速さ）で振幅変調したもの
+    t = np.arange(length) / FRAME_RATE
+    f0 = rng.uniform(110, 220)
+
+    voice = np.zeros(length)
+    for harmonic in range(1, 16):
+        voice += np.sin(2 * np.pi * f0 * harmonic * t + rng.uniform(0, 2 * np.pi)) / harmonic
+
+    voice *= 0.6 + 0.4 * np.sin(2 * np.pi * rng.uniform(3, 6) * t)
+
+    # 立ち上がり・立ち下がり 20ms
+    fade = min(int(0.02 * FRAME_RATE), length // 2)
+    voice[:fade] *= np.linspace(0, 1, fade)
+    voice[length - fade:] *= np.linspace(1, 0, fade)
+
+    return voice / np.sqrt(np.mean(voice ** 2))
+
+def writeWav(fileName, datas):
+
+    ww = wave.open(fileName, "wb")
+    ww.setnchannels(1)
+    ww.setsampwidth(2)
+    ww.setframerate(FRAME_RATE)
+    ww.writeframes(datas.astype("<i2").tobytes())
+    ww.close()
+
+def makeCase(fileName, seconds, snr, rng, speechRms=3000.0):
+
+    length = int(seconds * FRAME_RATE)
+
+    # 発話は全体の20%〜70%の間のどこか（最短0.3秒）
+    onset = int(rng.uniform(0.1, 0.3) * length)
+    offset = max(onset + int(0.3 * FRAME_RATE), int(rng.uniform(0.5, 0.8) * length))
+    offset = min(offset, length - 1)
+
+    datas = np.zeros(length)
+    datas[onset:offset] = makeSpeech(offset - onset, rng) * speechRms
+
+    noiseRms = speechRms / (10 ** (snr / 20.0))
+    datas += rng.normal(0, noiseRms, length)
+
+    writeWav(fileName, np.clip(np.round(datas), -32768, 32767))
+
+    return {"fileName": fileName, "seconds": seconds, "snr": snr, "onset": onset / FRAME_RATE, "offset": offset / FRAME_RATE}
+
+def makeCorpus(dirPath, lengths=LENGTHS, snrs=SNRS, count=4, seed=0):
+
+    # analyze.listWavPathsで読めるように BAT_Ver*/wavs/test1_NN_*.wav の形で置く
+    wavDir = os.path.join(dirPath, "BAT_Verbench_benchmark_2000.01.01_00.00.00", "wavs")
+    os.makedirs(wavDir, exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+
+    cases = []
+    for seconds in lengths:
+        for snr in snrs:
+            for i in range(count):
+                fileName = os.path.join(wavDir, "test1_%02d_%gs_%gdB.wav" % (len(cases), seconds, snr))
+                cases.append(makeCase(fileName, seconds, snr, rng))
+
+    return cases
+
+def detectionErrors(case, result):
+
+    startTime, endTime, interval = result
+
+    if "Input Low" in (startTime, endTime):
+        return None
+
+    return abs(startTime - case["onset"]), abs(endTime - case["offset"])
+
+def timeAnalyzer(analyzeMethod, cases, params, figDir=None, repeat=3):
+
+    # 時間はrepeat回のうち最も速かった回（他の処理の影響を減らす）
+    wallTime = np.inf
+    cpuTime = np.inf
+
+    for i in range(repeat):
+
+        errors = []
+        missCount = 0
+        wallTotal = 0.0
+        cpuTotal = 0.0
+
+        for case in cases:
+
+            if figDir is None:
+                figName = ""
+            else:
+                figName = analyze.figNameOf(wavPath=case["fileName"], figDir=figDir, analyzeMethod=analyzeMethod)
+
+            wallStart = time.perf_counter()
+            cpuStart = time.process_time()
+
+            result = analyze.analyzeFile(analyzeMethod, case["fileName"], figName, params)
+
+            wallTotal += time.perf_counter() - wallStart
+            cpuTotal += time.process_time() - cpuStart
+
+            error = detectionErrors(case, result)
+            if error is None:
+                missCount += 1
+            else:
+                errors.append(error)
+
+        wallTime = min(wallTime, wallTotal)
+        cpuTime = min(cpuTime, cpuTotal)
+
+    audioSeconds = sum(case["seconds"] for case in cases)
+    errors = np.array(errors).reshape(-1, 2)
+
+    return {
+        "files": len(cases),
+        "audioSeconds": audioSeconds,
+        "wallTime": wallTime,
+        "cpuTime": cpuTime,
+        "filesPerSecond": len(cases) / wallTime,
+        "audioSecondsPerSecond": audioSeconds / wallTime,
+        "missCount": missCount,
+        "startErrorMean": float(np.mean(errors[:, 0])) if len(errors) > 0 else None,
+        "startErrorMax": float(np.max(errors[:, 0])) if len(errors) > 0 else None,
+        "endErrorMean": float(np.mean(errors[:, 1])) if len(errors) > 0 else None,
+        "endErrorMax": float(np.max(errors[:, 1])) if len(errors) > 0 else None,
+    }
+
+def measurePeakMemory(analyzeMethod, case, params):
+
+    # tracemallocはnumpyの配列の確保も数える（計測中は遅くなるので時間とは別に測る）
+    tracemalloc.start()
+    try:
+        analyze.analyzeFile(analyzeMethod, case["fileName"], "", params)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+def timeExcel(dirPath, count=32, repeat=5):
+
+    filePath = os.path.join(dirPath, "result.xlsx")
+    results = [[1.0 + i * 0.01, 2.0 + i * 0.01, 1.0] for i in range(count)]
+    reads = ["a"] * count
+
+    timings = {}
+
+    wallStart = time.perf_counter()
+    for i in range(repeat):
+        if os.path.exists(filePath):
+            os.remove(filePath)
+        for mode in analyze.CELL_RECORD_POSITION.keys():
+            analyze.writeSessionResult(filePath=filePath, templatePath=TEMPLATE_PATH, mode=mode, analyzeMethod="Mix", reads=reads, results=results)
+    timings["writeSessionResult"] = (time.perf_counter() - wallStart) / (repeat * len(analyze.CELL_RECORD_POSITION))
+
+    wallStart = time.perf_counter()
+    for i in range(repeat):
+        excel.over_write_list_2d(filePath=filePath, sheetName=analyze.RESULT_SHEET_NAME, l_2d=results, start_row=3, start_col=2)
+    timings["over_write_list_2d"] = (time.perf_counter() - wallStart) / repeat
+
+    wallStart = time.perf_counter()
+    for i in range(repeat):
+        excel.get_list_2d(filePath=filePath, sheetName=analyze.RESULT_SHEET_NAME, start_row=3, end_row=3 + count - 1, start_col=2, end_col=4)
+    timings["get_list_2d"] = (time.perf_counter() - wallStart) / repeat
+
+    return timings
+
+def environment():
+
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpuCount": os.cpu_count(),
+    }
+
+def runBenchmark(workDir, methods=METHODS, lengths=LENGTHS, snrs=SNRS, count=4, withFigures=True, params=None):
+
+    if params is None:
+        params = analyze.makeParams(useFeatureCache=False, figureMode="inline")
+
+    cases = makeCorpus(workDir, lengths=lengths, snrs=snrs, count=count)
+    figDir = os.path.join(workDir, "figs")
+    os.makedirs(figDir, exist_ok=True)
+
+    report = {"environment": environment(), "params": params, "analyzers": [], "excel": None}
+
+    for analyzeMethod in methods:
+
+        # 最初の1回はimportやFFTの準備を含むので捨てる
+        analyze.analyzeFile(analyzeMethod, cases[0]["fileName"], "", params)
+
+        # 長さとSNRの組ごとに測る（SNRで検出の手間が変わるので平均しない）
+        for seconds in lengths:
+            for snr in snrs:
+
+                group = [case for case in cases if case["seconds"] == seconds and case["snr"] == snr]
+
+                entry = {"method": analyzeMethod, "seconds": seconds, "snr": snr, "figure": False}
+                entry.update(timeAnalyzer(analyzeMethod, group, params))
+                entry["peakMemory"] = max(measurePeakMemory(analyzeMethod, case, params) for case in group)
+                report["analyzers"].append(entry)
+
+                print("%-4s %5.1fs %5.1fdB          %7.1f files/s %8.1f audio-s/s %6.1f MB" % (analyzeMethod, seconds, snr, entry["filesPerSecond"], entry["audioSecondsPerSecond"], entry["peakMemory"] / 2**20))
+
+                if withFigures:
+
+                    # 図を描く場合は十分遅いので1回だけ測る
+                    entry = {"method": analyzeMethod, "seconds": seconds, "snr": snr, "figure": True}
+                    entry.update(timeAnalyzer(analyzeMethod, group, params, figDir=figDir, repeat=1))
+                    report["analyzers"].append(entry)
+
+                    print("%-4s %5.1fs %5.1fdB +figure  %7.1f files/s %8.1f audio-s/s" % (analyzeMethod, seconds, snr, entry["filesPerSecond"], entry["audioSecondsPerSecond"]))
+
+    report["excel"] = timeExcel(workDir)
+
+    return report
+
+def entryKey(entry):
+
+    # SNRごとに測る前のレポートには"snr"が無い（比較の対象にならない）
+    snr = "%gdB" % entry["snr"] if "snr" in entry else "allSnr"
+
+    return "%s/%gs/%s/%s" % (entry["method"], entry["seconds"], snr, "figure" if entry["figure"] else "noFigure")
+
+def compareReports(oldReport, newReport, tolerance=REGRESSION_TOLERANCE):
+
+    # スループットがtolerance以上落ちたもの
+    oldEntries = {entryKey(entry): entry for entry in oldReport["analyzers"]}
+    regressions = []
+
+    for entry in newReport["analyzers"]:
+
+        oldEntry = oldEntries.get(entryKey(entry))
+        if oldEntry is None:
+            continue
+
+        ratio = entry["filesPerSecond"] / oldEntry["filesPerSecond"]
+        print("%-24s %7.1f -> %7.1f files/s (x%.2f)" % (entryKey(entry), oldEntry["filesPerSecond"], entry["filesPerSecond"], ratio))
+
+        if ratio < 1.0 - tolerance:
+            regressions.append((entryKey(entry), ratio))
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the analyzers on synthetic recordings with known onsets.")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", default=None, help="previous benchmark json; exits with 1 on regressions")
+    parser.add_argument("--method", action="append", choices=METHODS, help="repeatable (default: all)")
+    parser.add_argument("--lengths", default=",".join("%g" % seconds for seconds in LENGTHS), help="seconds, comma separated")
+    parser.add_argument("--snrs", default=",".join("%g" % snr for snr in SNRS), help="dB, comma separated")
+    parser.add_argument("--count", type=int, default=4, help="files per length and SNR")
+    parser.add_argument("--no-figure", action="store_true")
+    parser.add_argument("--mix-engine", default=analyze.MIX_ENGINE, choices=["exact", "fast", "frame"])
+    parser.add_argument("--precision", default=analyze.PRECISION, choices=list(analyze.PRECISIONS.keys()))
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    params = analyze.makeParams(mixEngine=args.mix_engine, useFeatureCache=False, figureMode="inline", precision=args.precision)
+
+    workDir = tempfile.mkdtemp(prefix="bat_benchmark_")
+    try:
+        report = runBenchmark(workDir, methods=args.method or METHODS,
+                              lengths=[float(value) for value in args.lengths.split(",")],
+                              snrs=[float(value) for value in args.snrs.split(",")],
+                              count=args.count, withFigures=not args.no_figure, params=params)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print("Wrote %s" % args.output)
+
+    if args.compare is not None:
+
+        with open(args.compare) as f:
+            oldReport = json.load(f)
+
+        regressions = compareReports(oldReport, report, tolerance=args.tolerance)
+        for key, ratio in regressions:
+            print("REGRESSION %s: x%.2f" % (key, ratio))
+
+        sys.exit(1 if len(regressions) > 0 else 0)
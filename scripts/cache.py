@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# MFCC特徴量のディスクキャッシュ
+# wavの中身のハッシュと特徴量のパラメータをキーにして、セッションのcacheフォルダに.npyで保存する
+
+import os
+import glob
+import hashlib
+import uuid
+
+import numpy as np
+
+
+CACHE_DIR_NAME = "cache"
+DEFAULT_MAX_BYTES = 256 * 2**20 # 256MB
+
+
+def fileHash(fileName, blockSize=2**20):
+
+    h = hashlib.sha1()
+
+    with open(fileName, "rb") as f:
+        for data in iter(lambda: f.read(blockSize), b""):
+            h.update(data)
+
+    return h.hexdigest()
+
+def cacheDirOf(fileName):
+
+    # <session>/wavs/xxx.wav => <session>/cache
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(fileName))), CACHE_DIR_NAME)
+
+
+class FeatureCache:
+
+    def __init__(self, cacheDir, maxBytes=DEFAULT_MAX_BYTES):
+
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+
+    def key(self, fileName, params):
+
+        h = hashlib.sha1()
+        h.update(fileHash(fileName).encode())
+        h.update(repr(sorted(params.items())).encode())
+
+        return h.hexdigest()
+
+    # keyを渡すとwavのハッシュを計算し直さない（getとputで同じkeyを使う）
+    def get(self, fileName, params, key=None):
+
+        if key is None:
+            key = self.key(fileName, params)
+
+        path = os.path.join(self.cacheDir, key + ".npy")
+
+        try:
+            features = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+        # 最近使ったものを残すため更新時刻を新しくする
+        os.utime(path)
+
+        return features
+
+    def put(self, fileName, params, features, key=None):
+
+        if key is None:
+            key = self.key(fileName, params)
+
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir, exist_ok=True)
+
+        path = os.path.join(self.cacheDir, key + ".npy")
+
+        # 並列で書き込まれても壊れたファイルを読まないように、一時ファイルから置き換える
+        tempPath = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+        with open(tempPath, "wb") as f:
+            np.save(f, features)
+        os.replace(tempPath, path)
+
+        self.evict()
+
+    def getOrCompute(self, fileName, params, compute):
+
+        key = self.key(fileName, params)
+        features = self.get(fileName, params, key=key)
+
+        if features is None:
+            features = compute()
+            self.put(fileName, params, features, key=key)
+
+        return features
+
+    def evict(self):
+
+        # 合計サイズがmaxBytesを超えたら古いものから消す
+        entries = []
+        for path in glob.glob(os.path.join(self.cacheDir, "*.npy")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        totalBytes = sum(size for mtime, size, path in entries)
+
+        for mtime, size, path in sorted(entries):
+
+            if totalBytes <= self.maxBytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+            totalBytes -= size
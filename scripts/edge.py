@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# 閾値判定の結果（boolの配列）から発話区間の端を探す
+
+import numpy as np
+
+
+def findEdges(mask):
+
+    # 最初と最後にTrueになる位置（無ければNone）
+    mask = np.asarray(mask, dtype=bool)
+
+    if not mask.any():
+        return None
+
+    first = int(np.argmax(mask))
+    last = len(mask) - 1 - int(np.argmax(mask[::-1]))
+
+    return first, last
+
+def findSegments(mask):
+
+    # Trueが続く区間ごとの [開始, 終了]（終了を含む）を (区間数, 2) の配列で返す
+    mask = np.asarray(mask, dtype=bool)
+
+    changes = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+
+    starts = np.flatnonzero(changes == 1)
+    ends = np.flatnonzero(changes == -1) - 1
+
+    return np.column_stack((starts, ends))
+
+def findCrossings(values, threshold):
+
+    # 閾値を超える最初と最後の位置、および超えている区間の一覧
+    mask = values > threshold
+
+    return findEdges(mask), findSegments(mask)
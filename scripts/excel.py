@@ -1,55 +1,128 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import os
+import pickle
+
 import openpyxl
 
 
+# 読み込んだテンプレートのブックをpickleしたもの（プロセスごとに一度だけ解析する）
+templateCache = {}
+
+
 def get_value_list(t_2d):
     return([[cell.value for cell in row] for row in t_2d])
 
 def get_list_2d(filePath, sheetName, start_row, end_row, start_col, end_col):
 
-    wb = openpyxl.load_workbook(filePath)
-    sheet = wb[sheetName]
+    # 読むだけなので読み取り専用（ストリーミング）で開く
+    wb = openpyxl.load_workbook(filePath, read_only=True)
 
-    return get_value_list(sheet.iter_rows(min_row=start_row,
-                                          max_row=end_row,
-                                          min_col=start_col,
-                                          max_col=end_col))
+    try:
+        sheet = wb[sheetName]
 
-def over_write_list_2d(filePath, sheetName, l_2d, start_row, start_col):
+        return get_value_list(sheet.iter_rows(min_row=start_row,
+                                              max_row=end_row,
+                                              min_col=start_col,
+                                              max_col=end_col))
+    finally:
+        wb.close()
+
+def load_template(templatePath):
+
+    # テンプレートが更新されていなければ前回解析したブックから新しいブックを作る（ブックは書き込み先ごとに別のもの）
+    # copy.deepcopyしたブックは保存できないので、pickleから作り直す
+    key = os.path.abspath(templatePath)
+    mtime = os.stat(templatePath).st_mtime_ns
+
+    cached = templateCache.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, pickle.dumps(openpyxl.load_workbook(templatePath)))
+        templateCache[key] = cached
+
+    return pickle.loads(cached[1])
+
+class WorkbookWriter:
+
+    # ブックを一度だけ開き、書き込みはメモリ上に溜めてsave()でまとめて保存する
+    def __init__(self, filePath, templatePath=None):
+
+        self.filePath = filePath
+
+        if templatePath is not None and not os.path.isfile(filePath):
+            self.wb = load_template(templatePath)
+            self.isDirty = True
+        else:
+            self.wb = openpyxl.load_workbook(filePath)
+            self.isDirty = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+
+        # 例外で抜けた場合は途中までの書き込みを保存しない
+        try:
+            if excType is None:
+                self.save()
+        finally:
+            self.close()
 
-    wb = openpyxl.load_workbook(filePath)
-    sheet = wb[sheetName]
+    def write_list_2d(self, sheetName, l_2d, start_row, start_col):
 
-    for y, row in enumerate(l_2d):
-        for x, cell in enumerate(row):
+        sheet = self.wb[sheetName]
+
+        for y, row in enumerate(l_2d):
+            for x, cell in enumerate(row):
+                sheet.cell(row=start_row + y,
+                           column=start_col + x,
+                           value=l_2d[y][x])
+
+        self.isDirty = True
+
+    def write_one_value(self, sheetName, value, cell):
+
+        sheet = self.wb[sheetName]
+        sheet[cell] = value
+
+        self.isDirty = True
+
+    def write_list_1d(self, sheetName, l_1d, start_row, start_col):
+
+        sheet = self.wb[sheetName]
+
+        for y, row in enumerate(l_1d):
             sheet.cell(row=start_row + y,
-                       column=start_col + x,
-                       value=l_2d[y][x])
+                       column=start_col,
+                       value=row)
 
-    wb.save(filePath)
+        self.isDirty = True
 
-def over_write_one_value(filePath, sheetName, value, cell):
+    # チェックポイント（未保存の書き込みがある場合だけ保存する）
+    def save(self):
 
-    wb = openpyxl.load_workbook(filePath)
-    sheet = wb[sheetName]
-    sheet[cell] = value
+        if self.isDirty:
+            self.wb.save(self.filePath)
+            self.isDirty = False
 
-    wb.save(filePath)
+    def close(self):
+        self.wb.close()
 
-def over_write_list_1d(filePath, sheetName, l_1d, start_row, start_col):
+def over_write_list_2d(filePath, sheetName, l_2d, start_row, start_col):
 
-    wb = openpyxl.load_workbook(filePath)
-    sheet = wb[sheetName]
+    with WorkbookWriter(filePath) as writer:
+        writer.write_list_2d(sheetName, l_2d, start_row, start_col)
 
-    for y, row in enumerate(l_1d):
-        sheet.cell(row=start_row + y,
-                   column=start_col,
-                   value=row)
+def over_write_one_value(filePath, sheetName, value, cell):
+
+    with WorkbookWriter(filePath) as writer:
+        writer.write_one_value(sheetName, value, cell)
 
-    wb.save(filePath)
+def over_write_list_1d(filePath, sheetName, l_1d, start_row, start_col):
 
+    with WorkbookWriter(filePath) as writer:
+        writer.write_list_1d(sheetName, l_1d, start_row, start_col)
 
 if __name__ == '__main__':
 
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# 複数ファイルのMFCCをまとめて計算する
+# 各ファイルをpsf.mfccと同じようにフレームに分け、全ファイルのフレームを積み重ねてFFT・メルフィルタバンク・DCTを一度に行う。
+# 結果はmfcc.getMfcc / mix.getMfccと同じ（MFCC + Δ）。
+
+import numpy as np
+import python_speech_features as psf
+from scipy.fftpack import dct
+
+from scripts import audio, cache, mfcc, mix
+
+
+# 一度に積み重ねるフレーム数の上限（メモリを抑える）
+MAX_FRAMES = 2**15
+
+
+def framesOf(signal, frameRate, winlen=0.025, winstep=0.01, preemph=0.97):
+
+    # psf.sigproc.preemphasis と psf.sigproc.framesig と同じフレーム
+    emphasized = np.append(signal[0], signal[1:] - preemph * signal[:-1])
+
+    frameLen = int(psf.sigproc.round_half_up(winlen * frameRate))
+    frameStep = int(psf.sigproc.round_half_up(winstep * frameRate))
+
+    if len(emphasized) <= frameLen:
+        numFrames = 1
+    else:
+        numFrames = 1 + int(np.ceil((1.0 * len(emphasized) - frameLen) / frameStep))
+
+    padLen = (numFrames - 1) * frameStep + frameLen
+    padded = np.concatenate((emphasized, np.zeros(padLen - len(emphasized))))
+
+    # 重なったフレームはコピーせずにビューで作る
+    return np.lib.stride_tricks.sliding_window_view(padded, frameLen)[::frameStep]
+
+def mfccOfFrames(frames, frameRate, numcep=13, nfilt=26, nfft=512, ceplifter=22):
+
+    # psf.fbank / psf.mfcc の残りの処理（行ごとの計算なので積み重ねても結果は変わらない）
+    pspec = psf.sigproc.powspec(frames, nfft)
+
+    energy = np.sum(pspec, 1)
+    energy = np.where(energy == 0, np.finfo(float).eps, energy)
+
+    fb = psf.get_filterbanks(nfilt, nfft, frameRate, 0, frameRate / 2)
+    feat = np.dot(pspec, fb.T)
+    feat = np.where(feat == 0, np.finfo(float).eps, feat)
+
+    feat = np.log(feat)
+    feat = dct(feat, type=2, axis=1, norm="ortho")[:, :numcep]
+    feat = psf.lifter(feat, ceplifter)
+    feat[:, 0] = np.log(energy)
+
+    return feat
+
+def mfccBatch(signals, frameRate, maxFrames=MAX_FRAMES):
+
+    # 同じサンプリング周波数の信号の一覧 => それぞれの MFCC + Δ
+    frameSets = [framesOf(signal, frameRate) for signal in signals]
+    counts = [len(frames) for frames in frameSets]
+
+    mfccs = []
+    chunk = []
+    chunkFrames = 0
+
+    for frames in frameSets + [None]:
+
+        # 上限を超えそうなら、それまでのフレームをまとめて計算する
+        if frames is None or (chunkFrames > 0 and chunkFrames + len(frames) > maxFrames):
+            if chunkFrames > 0:
+                mfccs.append(mfccOfFrames(np.concatenate(chunk), frameRate))
+            chunk = []
+            chunkFrames = 0
+
+        if frames is not None:
+            chunk.append(frames)
+            chunkFrames += len(frames)
+
+    mfccs = np.split(np.concatenate(mfccs), np.cumsum(counts)[:-1])
+
+    return [np.c_[features, psf.delta(features, 2)] for features in mfccs]
+
+
+class PrecomputedFeatures:
+
+    # FeatureCacheと同じgetOrComputeで、まとめて計算済みの特徴量を渡す
+    def __init__(self, features, fallback=None):
+
+        self.features = features
+        self.fallback = fallback
+
+    def getOrCompute(self, fileName, params, compute):
+
+        key = (fileName, params["analyzer"])
+        if key in self.features:
+            return self.features[key]
+
+        if self.fallback is not None:
+            return self.fallback.getOrCompute(fileName, params, compute)
+
+        return compute()
+
+
+def signalOf(analyzeMethod, fileName, dtype=np.float64):
+
+    # 各解析のgetMfccに渡しているのと同じ信号
+    wav = audio.WavFile(fileName)
+
+    if analyzeMethod == "MFCC":
+        return wav.pcm, wav.frameRate
+
+    return wav.samples(dtype=dtype, scale=audio.LEGACY_SCALE), wav.frameRate
+
+def precompute(analyzeMethod, fileNames, dtype=np.float64, useFeatureCache=False):
+
+    # MFCCを使う解析の特徴量をまとめて計算する（キャッシュにあるものは計算しない）
+    # 返り値は PrecomputedFeatures に渡す {(fileName, analyzer): 特徴量}
+    # キャッシュのキー：MFCCの解析はint16のPCMから計算するので型によらず、Mixは読み込んだ信号の型ごとに分ける
+    mfccParams = {"MFCC": mfcc.MFCC_PARAMS, "Mix": mix.mfccParamsOf(dtype)}[analyzeMethod]
+
+    features = {}
+    signalsByRate = {}
+    cacheKeys = {}
+
+    for fileName in fileNames:
+
+        if useFeatureCache:
+            # wavのハッシュは一度だけ計算し、無かったときのputでも使う
+            featureCache = cache.FeatureCache(cacheDir=cache.cacheDirOf(fileName))
+            cacheKeys[fileName] = featureCache.key(fileName, mfccParams)
+
+            cached = featureCache.get(fileName, mfccParams, key=cacheKeys[fileName])
+            if cached is not None:
+                features[(fileName, mfccParams["analyzer"])] = cached
+                continue
+
+        signal, frameRate = signalOf(analyzeMethod, fileName, dtype=dtype)
+        signalsByRate.setdefault(frameRate, []).append((fileName, signal))
+
+    for frameRate, items in signalsByRate.items():
+
+        for (fileName, signal), mfccs in zip(items, mfccBatch([signal for fileName, signal in items], frameRate)):
+
+            features[(fileName, mfccParams["analyzer"])] = mfccs
+
+            if useFeatureCache:
+                cache.FeatureCache(cacheDir=cache.cacheDirOf(fileName)).put(fileName, mfccParams, mfccs, key=cacheKeys[fileName])
+
+    return features
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# 解析結果の図の描画
+# 各解析のrun(returnPlot=True)が返す配列（plotData）から図を作る。
+# plotDataを.npzに保存しておけば、描画は解析と別のプロセスや後からでもできる。
+
+import os
+import glob
+import gc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def pyplot():
+
+    # matplotlibは図を描くときに初めて読み込む（解析だけならimportしない）
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    return plt
+
+def drawSma(figName, powers, smas, frameRate, meanDb, threshold, startTime, endTime, isSilent):
+
+    plt = pyplot()
+
+    times = np.linspace(0, powers.size / frameRate, num=powers.size)
+
+    plt.figure(figsize=(12, 10))
+    plt.plot(times, powers, label="Power")
+    plt.plot(times, smas, "r", label="SMA")
+
+    if not isSilent:
+
+        plt.axhline(y=meanDb, xmin=0, xmax=1, color="gray", linewidth=2)
+        plt.axhline(y=threshold, xmin=0, xmax=1, color="pink", linewidth=2)
+        plt.axvline(ymin=0, ymax=1, x=startTime, color="green", linewidth=2)
+        plt.axvline(ymin=0, ymax=1, x=endTime, color="yellow", linewidth=2)
+
+    plt.legend()
+    plt.savefig(figName)
+
+    closeFigure()
+
+def drawMix(figName, vads, smas, frameRate, threshold, startTime, endTime, isSilent):
+
+    plt = pyplot()
+
+    times = np.linspace(0, vads.size / frameRate, num=vads.size)
+
+    plt.figure(figsize=(12, 10))
+    plt.plot(times, vads, label="MixPower")
+    plt.plot(times, smas, "r", label="SMA")
+
+    if not isSilent:
+
+        plt.axhline(y=threshold, xmin=0, xmax=1, color="pink", linewidth=2)
+        plt.axvline(ymin=0, ymax=1, x=startTime, color="green", linewidth=2)
+        plt.axvline(ymin=0, ymax=1, x=endTime, color="yellow", linewidth=2)
+
+    plt.legend()
+    plt.savefig(figName)
+
+    closeFigure()
+
+def drawMfcc(figName, mfcc, mfccPower, deltaPower, vad, vadPeekMin, vadPeekMax, mora, moraPeekMin, moraPeekMax, vadThreshold, vadSection, moraPositions):
+
+    plt = pyplot()
+
+    dataLength = len(mfcc)
+
+    # plot data
+    mfccHeatmap = mfcc[:, np.arange(1, 13)].T
+
+    # max len
+    xlim = [0, dataLength]
+
+    with plt.style.context('classic'):
+
+        plt.figure(figsize=(12, 10))
+        # heatmap
+        plt.subplot(5, 1, 1)
+        plt.xlim(xlim)
+        # plot.heatmap(heatmap)
+        plt.pcolor(mfccHeatmap, cmap=plt.cm.Blues)
+
+        # power, delta
+        plt.subplot(5, 1, 2)
+        plt.xlim(xlim)
+        plt.plot(mfccPower)
+        plt.plot(deltaPower)
+
+        # vad
+        plt.subplot(5, 1, 3)
+        plt.xlim(xlim)
+        plt.plot(vad)
+        sx = np.where(vadPeekMin == 1)[0]
+        sy = vad[sx]
+        plt.scatter(sx, sy, c="blue")
+        sx = np.where(vadPeekMax == 1)[0]
+        sy = vad[sx]
+        plt.scatter(sx, sy, c="red")
+        yline = [vadThreshold] * dataLength
+        plt.plot(yline)
+
+        # mora
+        plt.subplot(5, 1, 4)
+        plt.xlim(xlim)
+        plt.plot(mora)
+        sx = np.where(moraPeekMin == 1)[0]
+        sy = mora[sx]
+        plt.scatter(sx, sy, c="blue")
+        sx = np.where(moraPeekMax == 1)[0]
+        sy = mora[sx]
+        plt.scatter(sx, sy, c="red")
+
+        # vad
+        plt.subplot(5, 1, 5)
+        plt.xlim(xlim)
+        plt.plot(vadSection)
+        sx = np.where(moraPositions == 1)[0]
+        sy = np.ones(len(sx))
+        plt.scatter(sx, sy)
+
+        plt.savefig(figName)
+
+    closeFigure()
+
+def closeFigure():
+
+    plt = pyplot()
+
+    # ■■■ 追加 ■■■
+    plt.cla()
+    plt.clf()
+    plt.close()
+    gc.collect()
+
+
+DRAWERS = {"sma": drawSma, "mix": drawMix, "mfcc": drawMfcc}
+
+
+def draw(kind, figName, plotData):
+    DRAWERS[kind](figName, **plotData)
+
+def plotDataPathOf(figName):
+
+    root, ext = os.path.splitext(figName)
+    return root + ".npz"
+
+def savePlotData(figName, kind, plotData):
+
+    # 図の代わりに描画用の配列を保存する（<figName>.npz）
+    path = plotDataPathOf(figName)
+    np.savez(path, kind=kind, **plotData)
+
+    return path
+
+def renderPlotData(path, removePlotData=False):
+
+    with np.load(path) as npz:
+
+        kind = str(npz["kind"])
+        plotData = {key: npz[key] for key in npz.files if key != "kind"}
+
+    # フォルダごと移動されていても.npzの隣に描く
+    figName = os.path.splitext(path)[0] + ".png"
+
+    # 0次元の配列はスカラーに戻す
+    for key, value in plotData.items():
+        if value.ndim == 0:
+            plotData[key] = value.item()
+
+    draw(kind, figName, plotData)
+
+    if removePlotData:
+        os.remove(path)
+
+    return figName
+
+
+class FigureRenderer:
+
+    # 保存済みのplotDataをバックグラウンドのプロセスで図にする
+    def __init__(self, maxWorkers=None):
+        self.executor = ProcessPoolExecutor(max_workers=maxWorkers)
+
+    def submit(self, paths, removePlotData=False):
+        return [self.executor.submit(renderPlotData, path, removePlotData) for path in paths]
+
+    def shutdown(self, wait=True):
+
+        # wait=Falseでも投入済みの描画は続けて処理される
+        self.executor.shutdown(wait=wait)
+
+
+if __name__ == "__main__":
+
+    # 後から図を作る
+    # python -m scripts.figure <log>/<session>/figs
+    import sys
+
+    paths = []
+    for figDir in sys.argv[1:]:
+        paths.extend(glob.glob("%s/**/*.npz" % figDir, recursive=True))
+
+    renderer = FigureRenderer()
+    for future in renderer.submit(paths):
+        print("Wrote %s" % future.result())
+    renderer.shutdown()
@@ -28,11 +28,32 @@ class TextGraphicsSimpleTextItem(QGraphicsSimpleTextItem):
 
 class BoxGraphicsItem(QGraphicsItem):
 
+    # 形や色が変わったときだけ描き直す（描いた結果はデバイス座標のピクスマップにキャッシュする）
     def __init__(self, color, rect=QRectF(0, 0, 10, 10), parent=None):
         super().__init__(parent)
 
-        self.rect = rect
-        self.color = color
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+
+        self._rect = rect
+        self._color = color
+
+    @property
+    def rect(self):
+        return self._rect
+
+    @rect.setter
+    def rect(self, rect):
+        self.prepareGeometryChange()
+        self._rect = rect
+
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, color):
+        self._color = color
+        self.update()
 
     def paint(self, painter, option, widget):
         painter.setRenderHint(QPainter.Antialiasing)
@@ -52,9 +73,43 @@ class CrossGraphicsItem(QGraphicsItem):
     def __init__(self, color, size=120, lineWidth=40, parent=None):
         super().__init__(parent)
 
-        self.color = color
-        self.size = size
-        self.lineWidth = lineWidth
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+
+        # ポリゴンはsizeとlineWidthが変わったときだけ作り直す
+        self.polygon = None
+
+        self._color = color
+        self._size = size
+        self._lineWidth = lineWidth
+
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, color):
+        self._color = color
+        self.update()
+
+    @property
+    def size(self):
+        return self._size
+
+    @size.setter
+    def size(self, size):
+        self.prepareGeometryChange()
+        self._size = size
+        self.polygon = None
+
+    @property
+    def lineWidth(self):
+        return self._lineWidth
+
+    @lineWidth.setter
+    def lineWidth(self, lineWidth):
+        self._lineWidth = lineWidth
+        self.polygon = None
+        self.update()
 
     def paint(self, painter, option, widget):
         painter.setRenderHint(QPainter.Antialiasing)
@@ -64,8 +119,9 @@ class CrossGraphicsItem(QGraphicsItem):
         painter.setBrush(self.color)
 
         # ポリゴンを描画する。
-        poly = self.createShape()
-        painter.drawPolygon(poly)
+        if self.polygon is None:
+            self.polygon = self.createShape()
+        painter.drawPolygon(self.polygon)
 
     def createShape(self):
 
@@ -110,10 +166,34 @@ class EllipseGraphicsItem(QGraphicsItem):
     def __init__(self, radius, color, parent=None):
         super().__init__(parent)
 
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+
         self.edgeList = []
 
-        self.radius = radius
-        self.color = color
+        # 当たり判定の形はradiusが変わったときだけ作り直す
+        self.path = None
+
+        self._radius = radius
+        self._color = color
+
+    @property
+    def radius(self):
+        return self._radius
+
+    @radius.setter
+    def radius(self, radius):
+        self.prepareGeometryChange()
+        self._radius = radius
+        self.path = None
+
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, color):
+        self._color = color
+        self.update()
 
     def boundingRect(self): # 手直しの必要あり
         return QRectF(0.0, 0.0, self.radius * 2.0, self.radius * 2.0)
@@ -128,9 +208,12 @@ class EllipseGraphicsItem(QGraphicsItem):
         painter.drawRoundedRect(0.0, 0.0, self.radius * 2.0, self.radius * 2.0, self.radius, self.radius)
 
     def shape(self):
-        path = QPainterPath()
-        path.addEllipse(0.0, 0.0, self.radius * 2.0, self.radius * 2.0)
-        return path
+
+        if self.path is None:
+            self.path = QPainterPath()
+            self.path.addEllipse(0.0, 0.0, self.radius * 2.0, self.radius * 2.0)
+
+        return self.path
 
     def addEdge(self, edge):
         self.edgeList.append(edge)
@@ -151,9 +234,43 @@ class StarGraphicsItem(QGraphicsItem):
     def __init__(self, center, radius, color, parent=None):
         super().__init__(parent)
 
-        self.center = center
-        self.radius = radius
-        self.color = color
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+
+        # ポリゴンはcenterとradiusが変わったときだけ作り直す
+        self.polygon = None
+
+        self._center = center
+        self._radius = radius
+        self._color = color
+
+    @property
+    def center(self):
+        return self._center
+
+    @center.setter
+    def center(self, center):
+        self.prepareGeometryChange()
+        self._center = center
+        self.polygon = None
+
+    @property
+    def radius(self):
+        return self._radius
+
+    @radius.setter
+    def radius(self, radius):
+        self.prepareGeometryChange()
+        self._radius = radius
+        self.polygon = None
+
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, color):
+        self._color = color
+        self.update()
 
     def paint(self, painter, option, widget):
         painter.setRenderHint(QPainter.Antialiasing)
@@ -163,8 +280,9 @@ class StarGraphicsItem(QGraphicsItem):
         painter.setBrush(self.color)
 
         # ポリゴンを描画する。
-        poly = self.createShape()
-        painter.drawPolygon(poly)
+        if self.polygon is None:
+            self.polygon = self.createShape()
+        painter.drawPolygon(self.polygon)
 
     def createShape(self):
 
@@ -178,8 +296,7 @@ class StarGraphicsItem(QGraphicsItem):
         ys = self.center.y() + r * np.cos(theta)  # y 座標
 
         # QPolygonF に格納する。
-        polygon = QPolygonF()
-        [polygon.append(QPointF(x, y)) for x, y in zip(xs, ys)]
+        polygon = QPolygonF([QPointF(x, y) for x, y in zip(xs, ys)])
 
         return polygon
 
@@ -1,19 +1,14 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import gc
-
 import numpy as np
 import python_speech_features as psf
 import scipy
-import scipy.io
-import scipy.io.wavfile
 import scipy.ndimage
 import scipy.signal
 
+from scripts import audio, edge, figure, timing
+
 
 # python_speech_featuresのmfccメソッド
 # ========================================================================
@@ -28,9 +23,12 @@ import scipy.signal
 # 回帰係数 〇
 # であり子音の特徴を捉えるのに有効
 
+# 特徴量キャッシュのキーに含めるパラメータ（psf.mfccの既定値）
+MFCC_PARAMS = {"analyzer": "mfcc", "winlen": 0.025, "winstep": 0.01, "numcep": 13, "nfilt": 26, "nfft": 512, "preemph": 0.97, "delta": 2}
+
 def getMfcc(fileName):
-    (rate, sig) = scipy.io.wavfile.read(fileName)
-    mfcc = psf.mfcc(sig, rate)
+    wav = audio.WavFile(fileName)
+    mfcc = psf.mfcc(wav.pcm, wav.frameRate) # int16のまま渡す
     delta = psf.delta(mfcc, 2)
     # deltaDelta = psf.delta(delta, 2)
     # mfccFeature = np.c_[mfcc, delta, deltaDelta]
@@ -44,10 +42,10 @@ def getVadFluctuation(mfccPower, deltaPower, filterWidth=10):
     y = mfccPower * deltaPower
     y = scipy.ndimage.gaussian_filter(y, filterWidth)
     minId = scipy.signal.argrelmin(y, order=1)
-    minPeek = np.zeros(len(y))
+    minPeek = np.zeros(len(y), dtype=y.dtype)
     minPeek[minId] = 1
     maxId = scipy.signal.argrelmax(y, order=1)
-    maxPeek = np.zeros(len(y))
+    maxPeek = np.zeros(len(y), dtype=y.dtype)
     maxPeek[maxId] = 1
     return y, minPeek, maxPeek
 
@@ -56,112 +54,57 @@ def getMoraFlactuation(mfccPower, deltaPower, filterWidth=4):
     y = mfccPower * deltaPower
     y = scipy.ndimage.gaussian_filter(deltaPower, filterWidth)
     minId = scipy.signal.argrelmin(y, order=1)
-    minPeek = np.zeros(len(y))
+    minPeek = np.zeros(len(y), dtype=y.dtype)
     minPeek[minId] = 1
     maxId = scipy.signal.argrelmax(y, order=1)
-    maxPeek = np.zeros(len(y))
+    maxPeek = np.zeros(len(y), dtype=y.dtype)
     maxPeek[maxId] = 1
     return y, minPeek, maxPeek
 
 
-def run(fileName, figName, vadThreshold):
+def run(fileName, figName, vadThreshold, cache=None, returnPlot=False, dtype=np.float64):
 
     # defines
     # vadThreshold = 2 # 3
 
-    # MFCC取得
-    mfcc = getMfcc(fileName)
+    # MFCC取得（cacheがあれば同じwav・同じパラメータの特徴量を再利用する）
+    with timing.stage("mfcc"):
+        if cache is None:
+            mfcc = getMfcc(fileName)
+        else:
+            mfcc = cache.getOrCompute(fileName, MFCC_PARAMS, lambda: getMfcc(fileName))
+    mfcc = mfcc.astype(dtype, copy=False)
     dataLength = len(mfcc)
     mfccPower = mfcc[:, 0]
     deltaPower = mfcc[:, 13]
 
-    # Voice active detection
-    vad, vadPeekMin, vadPeekMax = getVadFluctuation(mfccPower, deltaPower)
+    with timing.stage("vad"):
+        # Voice active detection
+        vad, vadPeekMin, vadPeekMax = getVadFluctuation(mfccPower, deltaPower)
+
+        # mora
+        mora, moraPeekMin, moraPeekMax = getMoraFlactuation(mfccPower, deltaPower)
 
-    # mora
-    mora, moraPeekMin, moraPeekMax = getMoraFlactuation(mfccPower, deltaPower)
+    with timing.stage("threshold"):
+        # voice active detection
+        vadSection = np.zeros(dataLength, dtype=dtype)
+        vadSection[vad >= vadThreshold] = 1
+        moraPositions = np.zeros(dataLength, dtype=dtype)
+        moraPositions[np.where(moraPeekMax == 1)] = 1
+        moraPositions[vad <= vadThreshold] = 0
 
-    # voice active detection
-    vadSection = np.zeros(dataLength)
-    vadSection[vad >= vadThreshold] = 1
-    moraPositions = np.zeros(dataLength)
-    moraPositions[np.where(moraPeekMax == 1)] = 1
-    moraPositions[vad <= vadThreshold] = 0
+    plotData = {"mfcc": mfcc, "mfccPower": mfccPower, "deltaPower": deltaPower, "vad": vad, "vadPeekMin": vadPeekMin, "vadPeekMax": vadPeekMax, "mora": mora, "moraPeekMin": moraPeekMin, "moraPeekMax": moraPeekMax, "vadThreshold": vadThreshold, "vadSection": vadSection, "moraPositions": moraPositions}
 
     if figName != "":
+        with timing.stage("figure"):
+            figure.drawMfcc(figName, **plotData)
 
-        # plot data
-        mfccHeatmap = mfcc[:, np.arange(1, 13)].T
-
-        # max len
-        xlim = [0, dataLength]
-
-        plt.style.use('classic')
-        plt.figure(figsize=(12, 10))
-        # heatmap
-        plt.subplot(5, 1, 1)
-        plt.xlim(xlim)
-        # plot.heatmap(heatmap)
-        plt.pcolor(mfccHeatmap, cmap=plt.cm.Blues)
-
-        # power, delta
-        plt.subplot(5, 1, 2)
-        plt.xlim(xlim)
-        plt.plot(mfccPower)
-        plt.plot(deltaPower)
-
-        # vad
-        plt.subplot(5, 1, 3)
-        plt.xlim(xlim)
-        plt.plot(vad)
-        sx = np.where(vadPeekMin == 1)[0]
-        sy = vad[sx]
-        plt.scatter(sx, sy, c="blue")
-        sx = np.where(vadPeekMax == 1)[0]
-        sy = vad[sx]
-        plt.scatter(sx, sy, c="red")
-        yline = [vadThreshold] * dataLength
-        plt.plot(yline)
+    edges = edge.findEdges(vadSection == 1)
 
-        # mora
-        plt.subplot(5, 1, 4)
-        plt.xlim(xlim)
-        plt.plot(mora)
-        sx = np.where(moraPeekMin == 1)[0]
-        sy = mora[sx]
-        plt.scatter(sx, sy, c="blue")
-        sx = np.where(moraPeekMax == 1)[0]
-        sy = mora[sx]
-        plt.scatter(sx, sy, c="red")
-
-        # vad
-        plt.subplot(5, 1, 5)
-        plt.xlim(xlim)
-        plt.plot(vadSection)
-        sx = np.where(moraPositions == 1)[0]
-        sy = np.ones(len(sx))
-        plt.scatter(sx, sy)
-        # vadSection
-        # moraPositions
-
-        plt.savefig(figName)
-
-        # ■■■ 追加 ■■■
-        plt.cla()
-        plt.clf()
-        plt.close()
-        gc.collect()
-
-    calcIntervals = []
-    for i in range(len(vadSection)):
-
-        if vadSection[i] == 1:
-            calcIntervals.append(i)
-
-    if len(calcIntervals) > 0:
-
-        startTime = calcIntervals[0] / 100.0
-        endTime = calcIntervals[-1] / 100.0
+    if edges is not None:
+
+        startTime = edges[0] / 100.0
+        endTime = edges[1] / 100.0
         interval = endTime - startTime
 
     else:
@@ -169,21 +112,22 @@ def run(fileName, figName, vadThreshold):
         endTime = "Input Low"
         interval = "Input Low"
 
+    # returnPlot=Trueなら描画用の配列も返す（描画は呼び出し側で後から行う）
+    if returnPlot:
+        return startTime, endTime, interval, plotData
+
     return startTime, endTime, interval
 
 
 if __name__ == "__main__":
 
+    # リポジトリのフォルダで python -m scripts.mfcc <wav> <fig.png> <vadThreshold> として実行する
     import sys
 
     fileName = sys.argv[1]
     figName = sys.argv[2]
-    vadThreshold = sys.argv[3]
+    vadThreshold = float(sys.argv[3])
 
     startTime, endTime, interval = run(fileName=fileName, figName=figName, vadThreshold=vadThreshold)
 
     print("%f,%f,%f" % (startTime, endTime, interval))
-
-"""
-python mfcc.py
-"""
@@ -2,42 +2,64 @@
 # coding: utf-8
 
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import wave
-import gc
 import python_speech_features as psf
 from scipy import interpolate
 import scipy.ndimage
 
+from scripts import audio, average, edge, figure, timing
 
-def ReadWavFile(fileName):
+
+def ReadWavFile(fileName, dtype=np.float64):
 
     try:
-        wr = wave.open(fileName, "r")
+        return audio.readWav(fileName, dtype=dtype)
     except FileNotFoundError: #ファイルが存在しなかった場合
         print("[Error 404] No such file or directory: " + fileName)
         return 0
 
-    framerate = wr.getframerate()
+def simpleMovingAverage(datas, window):
+    return average.movingAverage(datas, window) # 移動平均（累積和でO(n)）
 
-    data = wr.readframes(wr.getnframes())
-    wr.close()
+# 特徴量キャッシュのキーに含めるパラメータ（psf.mfccの既定値と読み込み時のスケール）
+MFCC_PARAMS = {"analyzer": "mix", "scale": audio.LEGACY_SCALE, "winlen": 0.025, "winstep": 0.01, "numcep": 13, "nfilt": 26, "nfft": 512, "preemph": 0.97, "delta": 2}
 
-    x = np.frombuffer(data, dtype="int16") / float((2 ^ 15))
-    return x, framerate
+def mfccParamsOf(dtype=np.float64):
 
-def simpleMovingAverage(datas, window):
+    # 読み込んだ信号の型でMFCCが僅かに変わるので、型ごとに別のキーにする
+    return dict(MFCC_PARAMS, dtype=np.dtype(dtype).name)
+
+# psf.mfccに一度に渡すフレーム数（信号全体のフレームの配列をfloat64で作らない）
+MFCC_BLOCK_FRAMES = 1000
+
+def getMfcc(sigs, rate, blockFrames=MFCC_BLOCK_FRAMES):
+
+    # psf.mfcc(sigs, rate) と同じフレームをblockFramesずつ計算する
+    frameLen = int(psf.sigproc.round_half_up(MFCC_PARAMS["winlen"] * rate))
+    frameStep = int(psf.sigproc.round_half_up(MFCC_PARAMS["winstep"] * rate))
+    blockLen = (blockFrames - 1) * frameStep + frameLen
+
+    blocks = []
+    start = 0
+
+    while True:
+
+        # 残りがblockFramesフレームに収まれば、末尾の0詰めもpsf.mfccに任せる
+        isLast = len(sigs) - start <= blockLen
+        end = len(sigs) if isLast else start + blockLen
 
-    unit = np.ones(window) / window
-    smas = np.convolve(datas, unit, mode="same") # 移動平均
+        if start == 0:
+            blocks.append(psf.mfcc(sigs[:end], rate))
+        else:
+            # プリエンファシスはブロックの前のサンプルを使うので自前で行う（psfと同じく信号の型のまま）
+            emphasized = sigs[start:end] - MFCC_PARAMS["preemph"] * sigs[start - 1:end - 1]
+            blocks.append(psf.mfcc(emphasized, rate, preemph=0))
 
-    return smas
+        if isLast:
+            break
 
-def getMfcc(sigs, rate):
+        start += blockFrames * frameStep
 
-    mfccs = psf.mfcc(sigs, rate)
+    mfccs = np.concatenate(blocks)
     deltas = psf.delta(mfccs, 2)
     mfccFeatures = np.c_[mfccs, deltas]
 
@@ -53,39 +75,208 @@ def getVadFluctuation(mfccPowers, deltaPowers, filterWidth=10):
 
     return y
 
-def run(fileName, figName, smaThresholdRate=0.1, smaWindowSize=100, minNoiseLevel=1.0):
+def fitEnvelope(envelopes, engine="exact"):
+
+    x_observed = np.arange(0, len(envelopes), 1)  # 時間軸
+
+    if engine == "exact":
+        return interpolate.interp1d(x_observed, envelopes, kind="cubic")
+
+    # interp1dのcubicと同じnot-a-knotの3次スプラインを区分多項式のまま評価する（速い）
+    return interpolate.CubicSpline(x_observed, envelopes)
+
+def upsampleEnvelope(envelopes, length, engine="exact", dtype=np.float64, blockSize=average.BLOCK_SIZE):
+
+    # 全サンプル分のfloat64の配列を作らないよう、ブロックごとに評価してdtypeの配列に書く
+    # x_latentsは np.linspace(0, len(envelopes) - 1, length) と同じ値
+    fitted_curve = fitEnvelope(envelopes, engine=engine)
+    step = (len(envelopes) - 1) / (length - 1) if length > 1 else 0.0
+
+    upsampled = np.empty(length, dtype=dtype)
+
+    for start in range(0, length, blockSize):
+
+        end = min(length, start + blockSize)
+
+        x_latents = np.arange(start, end, dtype=np.float64) * step
+        if end == length and length > 1:
+            x_latents[-1] = len(envelopes) - 1
+
+        upsampled[start:end] = fitted_curve(x_latents)
+
+    return upsampled
+
+def detectByFrames(powers, envelopes, smaThresholdRate=0.1, smaWindowSize=100, margin=2, peakRate=0.5):
+
+    # フレーム単位で大まかに検出し、最大値と端の付近だけサンプル単位で計算し直す
+    length = len(powers)
+    frameLength = len(envelopes)
+    hop = (length - 1) / (frameLength - 1) # 1フレームあたりのサンプル数
+
+    fitted_curve = fitEnvelope(envelopes, engine="fast")
+
+    # 各フレームに最も近いサンプルの区間ごとの平均パワー
+    bounds = np.round((np.arange(frameLength) - 0.5).clip(0) * hop).astype(np.int64)
+    framePowers = np.add.reduceat(powers, bounds) / np.diff(np.append(bounds, length))
+
+    coarseSmas = simpleMovingAverage(datas=envelopes * framePowers, window=max(1, int(round(smaWindowSize / hop))))
+    coarseMax = np.max(coarseSmas)
+    coarseEdges = edge.findEdges(coarseSmas > coarseMax * smaThresholdRate)
+
+    if coarseEdges is None:
+        coarseEdges = (0, frameLength - 1)
+
+    def exactSmas(startFrame, endFrame, width=margin):
+
+        # フレーム区間（前後widthフレーム）に対応するサンプル単位のSMA
+        a = max(0, int((startFrame - width) * hop))
+        b = min(length, int(np.ceil((endFrame + width + 1) * hop)))
+
+        lo = max(0, a - smaWindowSize)
+        hi = min(length, b + smaWindowSize)
+
+        x_latents = np.arange(lo, hi) * ((frameLength - 1) / (length - 1))
+        smas = simpleMovingAverage(datas=fitted_curve(x_latents) * powers[lo:hi], window=smaWindowSize)
+
+        return a, smas[a - lo:b - lo]
+
+    # 閾値の基準になる最大値は、まず大まかなSMAが大きいフレームの付近で探す
+    smaMax = -np.inf
+    for startFrame, endFrame in edge.findSegments(coarseSmas >= coarseMax * peakRate):
+        a, smas = exactSmas(startFrame, endFrame)
+        smaMax = max(smaMax, np.max(smas))
+
+    # 次に、SMAの上限がそれを超え得るフレームをすべて調べる（最大値は"exact"と同じになる）
+    for startFrame, endFrame in edge.findSegments(upperSmas(fitted_curve, powers, hop, smaWindowSize) >= smaMax):
+        a, smas = exactSmas(startFrame, endFrame, width=0)
+        smaMax = max(smaMax, np.max(smas))
+
+    threshold = smaMax * smaThresholdRate # 閾値
+
+    def refineEdge(coarseFrame, isStart):
+
+        # 開始は信号の先頭から、終了は信号の末尾まで調べるので、閾値を超える最初と最後の位置は"exact"と同じになる
+        # 大まかな端の前後widthフレームに閾値を超える位置が無ければ、広げて探し直す
+        width = max(1, margin)
+        while True:
+
+            if isStart:
+                a, smas = exactSmas(0, coarseFrame, width=width)
+            else:
+                a, smas = exactSmas(coarseFrame, frameLength - 1, width=width)
+
+            edges = edge.findEdges(smas > threshold)
+            if edges is not None:
+                return a + (edges[0] if isStart else edges[1])
+
+            # 信号全体に閾値を超える位置が無い
+            if a == 0 and a + len(smas) == length:
+                return None
+
+            width *= 2
+
+    predStart = refineEdge(coarseEdges[0], isStart=True)
+    if predStart is None:
+        return None
+
+    predEnd = refineEdge(coarseEdges[1], isStart=False)
+
+    return predStart, predEnd
+
+def upperSmas(fitted_curve, powers, hop, smaWindowSize):
+
+    # フレームjの区間（x が j 以上 j + 1 未満のサンプル）にあるサンプルのSMAの上限
+    # 窓が届く範囲の区間について、包絡の最大値（0以上）×パワーの合計 / 窓幅
+    length = len(powers)
+    frameLength = len(fitted_curve.x)
+
+    starts = np.minimum(np.ceil(np.arange(frameLength) * hop).astype(np.int64), length - 1)
+    intervalPowers = np.add.reduceat(powers, starts, dtype=np.float64)
+
+    # 包絡の区間ごとの最大値（両端と極値）
+    knots = fitted_curve(np.arange(frameLength))
+    intervalMax = np.maximum(knots, np.append(knots[1:], knots[-1]))
+
+    extrema = fitted_curve.derivative().roots(extrapolate=False)
+    extrema = extrema[np.isfinite(extrema)]
+    np.maximum.at(intervalMax, np.floor(extrema).astype(np.int64).clip(0, frameLength - 1), fitted_curve(extrema))
+
+    intervalMax = intervalMax.clip(0)
+
+    # 窓が届く区間（前後reachフレーム）
+    reach = int(np.ceil(smaWindowSize / hop)) + 1
+
+    envelopeMax = scipy.ndimage.maximum_filter1d(intervalMax, size=2 * reach + 1, mode="constant", cval=0.0)
+
+    csum = np.concatenate(([0.0], np.cumsum(intervalPowers)))
+    index = np.arange(frameLength)
+    powerSums = csum[np.minimum(index + reach + 1, frameLength)] - csum[np.maximum(index - reach, 0)]
+
+    # 浮動小数点の丸めの分だけ余裕を持たせる
+    return envelopeMax * powerSums / smaWindowSize * (1 + 1e-6)
+
+# engine
+#   "exact" : 従来どおりinterp1d（cubic）で全サンプルに補間する
+#   "fast"  : 同じスプラインを区分多項式で評価する（差は浮動小数点の丸め程度）
+#   "frame" : フレーム単位で検出し、最大値と発話の前後だけサンプル単位で求め直す
+#             最大値はSMAの上限が超え得るフレームをすべて調べ、端は信号の両端から探すので、"fast"と同じく差は丸め程度
+#             （許容差1サンプル。python -m scripts.precision <logRoot> --against-engine frame で確かめる）
+def run(fileName, figName, smaThresholdRate=0.1, smaWindowSize=100, minNoiseLevel=1.0, engine="exact", cache=None, returnPlot=False, dtype=np.float64):
 
     isSilent = False
 
-    wavs, frameRate = ReadWavFile(fileName=fileName)
+    with timing.stage("read"):
+        wavs, frameRate = ReadWavFile(fileName=fileName, dtype=dtype)
 
-    powers = wavs ** 2 # 信号のパワー
-    mfccs = getMfcc(wavs, frameRate)
+        powers = wavs ** 2 # 信号のパワー
+
+    # cacheがあれば同じwav・同じパラメータの特徴量を再利用する
+    with timing.stage("mfcc"):
+        if cache is None:
+            mfccs = getMfcc(wavs, frameRate)
+        else:
+            mfccs = cache.getOrCompute(fileName, mfccParamsOf(dtype), lambda: getMfcc(wavs, frameRate))
+
+    # psfの内部計算はfloat64なので、フレーム単位の特徴量になってから型を揃える
+    mfccs = mfccs.astype(dtype, copy=False)
 
     dataLength = len(mfccs)
     mfccPowers = mfccs[:, 0]
     deltaPowers = mfccs[:, 13]
 
     # Voice active detection
-    x_observed = np.arange(0, dataLength, 1)  # 時間軸
-    y_observed = getVadFluctuation(mfccPowers, deltaPowers)
+    with timing.stage("vad"):
+        y_observed = getVadFluctuation(mfccPowers, deltaPowers)
 
-    method = lambda x, y: interpolate.interp1d(x, y, kind="cubic")
-    fitted_curve = method(x_observed, y_observed)
+    if engine == "frame":
 
-    x_latents = np.linspace(min(x_observed), max(x_observed), len(powers))
-    fitted_curves = fitted_curve(x_latents).tolist()
+        with timing.stage("threshold"):
+            edges = detectByFrames(powers=powers, envelopes=y_observed, smaThresholdRate=smaThresholdRate, smaWindowSize=smaWindowSize)
 
-    vads = fitted_curves * powers
-    smas = simpleMovingAverage(datas=vads, window=smaWindowSize)
+        if figName != "" or returnPlot:
+            with timing.stage("plotData"):
+                vads = upsampleEnvelope(y_observed, len(powers), engine="fast", dtype=dtype)
+                vads *= powers
+                smas = simpleMovingAverage(datas=vads, window=smaWindowSize)
+                threshold = np.max(smas) * smaThresholdRate # 閾値
+    else:
+        with timing.stage("interpolate"):
+            vads = upsampleEnvelope(y_observed, len(powers), engine=engine, dtype=dtype)
+            vads *= powers
 
-    smaMax = np.max(smas)
-    threshold = smaMax * smaThresholdRate # 閾値
+        with timing.stage("sma"):
+            smas = simpleMovingAverage(datas=vads, window=smaWindowSize)
+
+        with timing.stage("threshold"):
+            smaMax = np.max(smas)
+            threshold = smaMax * smaThresholdRate # 閾値
+
+            edges = edge.findEdges(smas > threshold)
 
     # 平均音量（db）
     meanDb = 10 * np.log10(np.mean(powers))
 
-    if meanDb < minNoiseLevel:
+    if meanDb < minNoiseLevel or edges is None:
 
         startTime = "Input Low"
         endTime = "Input Low"
@@ -93,43 +284,29 @@ def run(fileName, figName, smaThresholdRate=0.1, smaWindowSize=100, minNoiseLeve
 
         isSilent = True
     else:
-        upIdx = [i for i, v in enumerate(smas > threshold) if v]
-        predStart, predEnd = upIdx[0], upIdx[-1]
+        predStart, predEnd = edges
 
         startTime = predStart / frameRate
         endTime = predEnd / frameRate
         interval = endTime - startTime
 
-    if figName != "":
-
-        times = np.linspace(0, vads.size / frameRate, num=vads.size)
+    if figName != "" or returnPlot:
+        plotData = {"vads": vads, "smas": smas, "frameRate": frameRate, "threshold": threshold, "startTime": np.nan if isSilent else startTime, "endTime": np.nan if isSilent else endTime, "isSilent": isSilent}
 
-        plt.figure(figsize=(12, 10))
-        plt.plot(times, vads, label="MixPower")
-        plt.plot(times, smas, "r", label="SMA")
-
-        if not isSilent:
-
-            # plt.axhline(y=meanDb, xmin=0, xmax=1, color="gray", linewidth=2)
-            plt.axhline(y=threshold, xmin=0, xmax=1, color="pink", linewidth=2)
-            plt.axvline(ymin=0, ymax=1, x=startTime, color="green", linewidth=2)
-            plt.axvline(ymin=0, ymax=1, x=endTime, color="yellow", linewidth=2)
-
-        plt.legend()
-        plt.savefig(figName)
-        # plt.show()
+    if figName != "":
+        with timing.stage("figure"):
+            figure.drawMix(figName, **plotData)
 
-        # ■■■ 追加 ■■■
-        plt.cla()
-        plt.clf()
-        plt.close()
-        gc.collect()
+    # returnPlot=Trueなら描画用の配列も返す（描画は呼び出し側で後から行う）
+    if returnPlot:
+        return startTime, endTime, interval, plotData
 
     return startTime, endTime, interval
 
 
 if __name__ == "__main__":
 
+    # リポジトリのフォルダで python -m scripts.mix <wav> <fig.png> として実行する
     import sys
 
     fileName = sys.argv[1]
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# float32で解析した開始・終了時刻がfloat64の結果と1サンプル（MFCCは1フレーム）以内で一致するかの確認
+# python -m scripts.precision ~/Documents/log [--method Mix]
+# --against-engine frame を付けると、Mixの"frame"の結果を"exact"の結果と比べる（どちらもfloat64）
+
+import sys
+import argparse
+
+import numpy as np
+
+from scripts import analyze, audio
+
+
+# 時刻の分解能（1サンプル・1フレームあたりの秒数）
+def resolutionOf(analyzeMethod, fileName):
+
+    if analyzeMethod == "MFCC":
+        return 1 / 100.0
+
+    return 1.0 / audio.WavFile(fileName).frameRate
+
+# variantは基準（float64）から変えるパラメータ
+def compareFile(analyzeMethod, fileName, params, variant={"precision": "float32"}):
+
+    reference = dict(params, precision="float64", useFeatureCache=False, blockSize=None)
+
+    expected = analyze.analyzeFile(analyzeMethod, fileName, "", reference)[:2]
+    actual = analyze.analyzeFile(analyzeMethod, fileName, "", dict(reference, **variant))[:2]
+
+    # どちらかが"Input Low"なら両方そうでなければならない
+    if "Input Low" in expected or "Input Low" in actual:
+        return None if expected == actual else np.inf
+
+    # ずれをサンプル（フレーム）数で返す
+    return max(abs(a - b) for a, b in zip(expected, actual)) / resolutionOf(analyzeMethod, fileName)
+
+def check(analyzeMethod, fileNames, params, tolerance=1.0, variant={"precision": "float32"}):
+
+    failures = []
+
+    for fileName in fileNames:
+        diff = compareFile(analyzeMethod, fileName, params, variant=variant)
+        if diff is not None and diff > tolerance + 1e-6:
+            failures.append((fileName, diff))
+
+    return failures
+
+
+if __name__ == "__main__":
+
+    from scripts import batch
+
+    parser = argparse.ArgumentParser(description="Check that float32 analysis matches float64 within one sample.")
+    parser.add_argument("logRoot")
+    parser.add_argument("--method", action="append", choices=list(analyze.FIG_SUFFIXES.keys()), help="repeatable (default: all)")
+    parser.add_argument("--mix-engine", default=analyze.MIX_ENGINE, choices=["exact", "fast", "frame"])
+    parser.add_argument("--against-engine", default=None, choices=["fast", "frame"], help="compare this Mix engine with \"exact\" instead of float32 with float64")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="samples (frames for MFCC)")
+    args = parser.parse_args()
+
+    fileNames = []
+    for logDir, info in batch.findSessions(args.logRoot):
+        for mode in batch.MODES:
+            fileNames.extend(analyze.listWavPaths(wavDirPath="%s/wavs" % logDir, mode=mode))
+
+    params = analyze.makeParams(mixEngine=args.mix_engine)
+    methods = args.method or list(analyze.FIG_SUFFIXES.keys())
+    variant = {"precision": "float32"}
+
+    if args.against_engine is not None:
+        params = dict(params, mixEngine="exact")
+        methods = ["Mix"]
+        variant = {"mixEngine": args.against_engine}
+
+    isFailed = False
+    for analyzeMethod in methods:
+
+        failures = check(analyzeMethod, fileNames, params, tolerance=args.tolerance, variant=variant)
+        print("%s: %d files, %d mismatches" % (analyzeMethod, len(fileNames), len(failures)))
+
+        for fileName, diff in failures:
+            print("  %s: %s samples" % (fileName, diff))
+
+        isFailed = isFailed or len(failures) > 0
+
+    sys.exit(1 if isFailed else 0)
@@ -1,6 +1,11 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import time
+import queue
+import threading
+
+import numpy as np
 import pyaudio  # 録音機能を使うためのライブラリ
 import wave     # wavファイルを扱うためのライブラリ
 
@@ -14,8 +19,12 @@ CHANNELS = 1             # モノラル
 RATE = 16000            # サンプルレート
 CHUNK = 2**11            # データ点数
 
+RING_SECONDS = 30.0      # リングバッファに残しておく時間（秒）
+READ_TIMEOUT = 2.0       # この時間データが届かなければデバイスが止まったとみなす（秒）
+
 
-def recording(fileName, recordSeconds):
+# callbackを渡すと、読み込んだCHUNKごとに録音データ（bytes）を渡して呼び出す
+def recording(fileName, recordSeconds, callback=None):
 
     audio = pyaudio.PyAudio() # pyaudio.PyAudio()
 
@@ -27,10 +36,13 @@ def recording(fileName, recordSeconds):
     #--------------録音開始---------------
 
     print("recording...")
-    frames = []
-    for i in range(0, int(RATE / CHUNK * recordSeconds)):
-        data = stream.read(CHUNK)
-        frames.append(data)
+    with WavWriter(fileName) as writer:
+        for i in range(0, int(RATE / CHUNK * recordSeconds)):
+            data = stream.read(CHUNK)
+            writer.write(data)
+
+            if callback is not None:
+                callback(data)
 
     print("finished recording")
 
@@ -40,12 +52,202 @@ def recording(fileName, recordSeconds):
     stream.close()
     audio.terminate()
 
-    waveFile = wave.open(fileName, 'wb')
-    waveFile.setnchannels(CHANNELS)
-    waveFile.setsampwidth(audio.get_sample_size(FORMAT))
-    waveFile.setframerate(RATE)
-    waveFile.writeframes(b''.join(frames))
-    waveFile.close()
+
+class WavWriter:
+
+    # 受け取った録音データを裏のスレッドでそのままwavに書き足す（全体をメモリに溜めない）
+    # wave.writeframesは書くたびにヘッダの長さを直すので、途中で落ちてもそれまでの録音は読めるwavとして残る
+    def __init__(self, fileName):
+
+        self.file = open(fileName, 'wb')
+        self.waveFile = wave.open(self.file, 'wb')
+        self.waveFile.setnchannels(CHANNELS)
+        self.waveFile.setsampwidth(pyaudio.get_sample_size(FORMAT))
+        self.waveFile.setframerate(RATE)
+
+        self.queue = queue.Queue()
+        self.error = None
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def write(self, data):
+        self.queue.put(data)
+
+    def run(self):
+
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+
+            # 書けなくなっても録音は止めず、close()で知らせる
+            if self.error is not None:
+                continue
+
+            try:
+                self.waveFile.writeframes(data)
+                self.file.flush()
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+
+        # 溜まっている分を書き終えてから閉じる
+        self.queue.put(None)
+        self.thread.join()
+        self.waveFile.close()
+        self.file.close()
+
+        if self.error is not None:
+            raise self.error
+
+
+class CaptureService:
+
+    # 入力デバイスをセッションの間一度だけ開き、リングバッファに録音し続ける
+    # 各項目の録音は、刺激を出した時刻（time.perf_counter()）からリングバッファを切り出すので、デバイスの準備を待たない
+    def __init__(self, ringSeconds=RING_SECONDS):
+
+        self.ring = np.zeros(int(RATE * ringSeconds), dtype=np.int16)
+
+        # 開始からの通算フレーム数と、最後のフレームを受け取った時刻
+        self.framesWritten = 0
+        self.clock = None
+
+        self.condition = threading.Condition()
+        self.audio = None
+        self.stream = None
+
+    def start(self):
+
+        self.audio = pyaudio.PyAudio()
+
+        # コールバック方式（PortAudioのスレッドでリングバッファに書き込む）
+        self.stream = self.audio.open(format=FORMAT, channels=CHANNELS,
+                                      rate=RATE, input=True,
+                                      input_device_index=iDeviceIndex,
+                                      frames_per_buffer=CHUNK,
+                                      stream_callback=self.onAudio)
+        self.stream.start_stream()
+
+    def stop(self):
+
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+        if self.audio is not None:
+            self.audio.terminate()
+            self.audio = None
+
+    def onAudio(self, inData, frameCount, timeInfo, status):
+
+        # このCHUNKの最初のサンプルをADCが取り込んだ時刻（取れないデバイスでは受け取った時刻から逆算する）
+        now = time.perf_counter()
+        adcTime, currentTime = timeInfo.get("input_buffer_adc_time", 0.0), timeInfo.get("current_time", 0.0)
+
+        if adcTime > 0.0 and currentTime > 0.0:
+            capturedAt = now - (currentTime - adcTime)
+        else:
+            capturedAt = now - frameCount / RATE
+
+        samples = np.frombuffer(inData, dtype=np.int16)
+
+        with self.condition:
+
+            # 末尾で折り返して書き込む
+            start = self.framesWritten % len(self.ring)
+            first = min(len(samples), len(self.ring) - start)
+            self.ring[start:start + first] = samples[:first]
+            self.ring[:len(samples) - first] = samples[first:]
+
+            # 通算フレーム番号 framesWritten の時刻
+            self.framesWritten += len(samples)
+            self.clock = (self.framesWritten, capturedAt + len(samples) / RATE)
+
+            self.condition.notify_all()
+
+        return (None, pyaudio.paContinue)
+
+    def frameAt(self, timestamp):
+
+        # time.perf_counter()の時刻 => 通算フレーム番号（最後に受け取ったデータから逆算する）
+        framesWritten, writtenAt = self.latestClock()
+
+        return framesWritten - int(round((writtenAt - timestamp) * RATE))
+
+    def timeOfFrame(self, frame):
+
+        # 通算フレーム番号 => time.perf_counter()の時刻
+        framesWritten, writtenAt = self.latestClock()
+
+        return writtenAt - (framesWritten - frame) / RATE
+
+    def latestClock(self):
+
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.clock is not None, timeout=READ_TIMEOUT):
+                raise RuntimeError("No audio from the input device")
+
+            return self.clock
+
+    def read(self, startFrame, frameCount, out=None):
+
+        # 通算フレーム startFrame から frameCount フレーム（届くまで待つ）
+        # outを渡すとそこに書き込む（CHUNKごとに配列を作らない）
+        if out is None:
+            out = np.empty(frameCount, dtype=np.int16)
+
+        # 録音を始める前の部分は無音
+        if startFrame + frameCount <= 0:
+            out[:] = 0
+            return out.tobytes()
+
+        begin = max(startFrame, 0)
+
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.framesWritten >= startFrame + frameCount, timeout=READ_TIMEOUT + frameCount / RATE):
+                raise RuntimeError("No audio from the input device")
+
+            if begin < self.framesWritten - len(self.ring):
+                raise RuntimeError("The recording was overwritten in the ring buffer")
+
+            out[:begin - startFrame] = 0
+
+            # リングバッファの末尾で折り返している場合は2回に分けてコピーする
+            start = begin % len(self.ring)
+            first = min(startFrame + frameCount - begin, len(self.ring) - start)
+            out[begin - startFrame:begin - startFrame + first] = self.ring[start:start + first]
+            out[begin - startFrame + first:] = self.ring[:frameCount - (begin - startFrame) - first]
+
+        return out.tobytes()
+
+    # recording()と同じく、callbackを渡すと読み込んだCHUNKごとに録音データ（bytes）を渡して呼び出す
+    # 録音の最初のサンプルの時刻（time.perf_counter()）を返す
+    def record(self, fileName, startTime, recordSeconds, callback=None):
+
+        startFrame = self.frameAt(startTime)
+        firstFrameAt = self.timeOfFrame(startFrame)
+
+        block = np.empty(CHUNK, dtype=np.int16)
+
+        with WavWriter(fileName) as writer:
+            for i in range(0, int(RATE / CHUNK * recordSeconds)):
+                data = self.read(startFrame + i * CHUNK, CHUNK, out=block)
+                writer.write(data)
+
+                if callback is not None:
+                    callback(data)
+
+        return firstFrameAt
 
 
 if __name__ == "__main__":
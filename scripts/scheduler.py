@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# 単調増加の時計（time.perf_counter()）の絶対時刻で予定を実行するスケジューラ
+# タイマーの間隔が遅れたり抜けたりしても、予定時刻を過ぎたものから順に実行するので時間が延びない。
+# 各予定の予定時刻と実際に実行した時刻は記録しておき、schedule_<mode>.csv に書く。
+
+import csv
+import time
+import heapq
+import itertools
+
+
+SCHEDULE_HEADER = ["name", "label", "plannedAt", "firedAt", "lateness"]
+
+
+class Scheduler:
+
+    def __init__(self, clock=time.perf_counter):
+
+        self.clock = clock
+        self.events = []
+        self.counter = itertools.count()
+
+        self.records = []
+
+        # 記録する時刻の基準（start()した時刻）
+        self.origin = None
+
+    def start(self):
+
+        self.origin = self.clock()
+
+        return self.origin
+
+    def at(self, deadline, name, callback, label=""):
+
+        # callbackには予定時刻を渡す（次の予定を実際の時刻ではなく予定時刻から決められるように）
+        heapq.heappush(self.events, (deadline, next(self.counter), name, label, callback))
+
+    def clear(self):
+        self.events = []
+
+    def poll(self):
+
+        # 予定時刻を過ぎたものを予定順に実行する（callbackの中で追加された予定も含む）
+        while len(self.events) > 0 and self.events[0][0] <= self.clock():
+
+            deadline, _, name, label, callback = heapq.heappop(self.events)
+            firedAt = self.clock()
+
+            self.records.append({
+                "name": name,
+                "label": label,
+                "plannedAt": deadline - self.origin,
+                "firedAt": firedAt - self.origin,
+                "lateness": firedAt - deadline,
+            })
+
+            callback(deadline)
+
+    def write(self, filePath):
+
+        with open(filePath, "w", newline="", encoding="utf-8-sig") as f:
+
+            writer = csv.DictWriter(f, fieldnames=SCHEDULE_HEADER)
+            writer.writeheader()
+            writer.writerows(self.records)
@@ -2,52 +2,42 @@
 # coding: utf-8
 
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import wave
-import gc
 
+from scripts import audio, average, edge, figure, timing
 
-def ReadWavFile(fileName):
+
+def ReadWavFile(fileName, dtype=np.float64):
 
     try:
-        wr = wave.open(fileName, "r")
+        return audio.readWav(fileName, dtype=dtype)
     except FileNotFoundError: #ファイルが存在しなかった場合
         print("[Error 404] No such file or directory: " + fileName)
         return 0
 
-    framerate = wr.getframerate()
-
-    data = wr.readframes(wr.getnframes())
-    wr.close()
-
-    x = np.frombuffer(data, dtype="int16") / float((2 ^ 15))
-    return x, framerate
-
 def simpleMovingAverage(datas, window):
+    return average.movingAverage(datas, window) # 移動平均（累積和でO(n)）
 
-    unit = np.ones(window) / window
-    smas = np.convolve(datas, unit, mode="same") # 移動平均
-
-    return smas
-
-def run(fileName, figName, thresholdRate=0.1, windowSize=100, minNoiseLevel=1.0):
+def run(fileName, figName, thresholdRate=0.1, windowSize=100, minNoiseLevel=1.0, returnPlot=False, dtype=np.float64):
 
     isSilent = False
 
-    wavs, frameRate = ReadWavFile(fileName=fileName)
-    powers = wavs ** 2 # 信号のパワー
+    with timing.stage("read"):
+        wavs, frameRate = ReadWavFile(fileName=fileName, dtype=dtype)
+        powers = wavs ** 2 # 信号のパワー
+
+    with timing.stage("sma"):
+        smas = simpleMovingAverage(datas=powers, window=windowSize)
 
-    smas = simpleMovingAverage(datas=powers, window=windowSize)
+    with timing.stage("threshold"):
+        smaMax = np.max(smas)
+        threshold = smaMax * thresholdRate # 閾値
 
-    smaMax = np.max(smas)
-    threshold = smaMax * thresholdRate # 閾値
+        # 平均音量（db）
+        meanDb = 10 * np.log10(np.mean(powers))
 
-    # 平均音量（db）
-    meanDb = 10 * np.log10(np.mean(powers))
+        edges = edge.findEdges(smas > threshold)
 
-    if meanDb < minNoiseLevel:
+    if meanDb < minNoiseLevel or edges is None:
 
         startTime = "Input Low"
         endTime = "Input Low"
@@ -55,48 +45,33 @@ def run(fileName, figName, thresholdRate=0.1, windowSize=100, minNoiseLevel=1.0)
 
         isSilent = True
     else:
-        upIdx = [i for i, v in enumerate(smas > threshold) if v]
-        predStart, predEnd = upIdx[0], upIdx[-1]
+        predStart, predEnd = edges
 
         startTime = predStart / frameRate
         endTime = predEnd / frameRate
         interval = endTime - startTime
 
-    if figName != "":
-
-        times = np.linspace(0, powers.size / frameRate, num=powers.size)
-
-        plt.figure(figsize=(12, 10))
-        plt.plot(times, powers, label="Power")
-        plt.plot(times, smas, "r", label="SMA")
+    plotData = {"powers": powers, "smas": smas, "frameRate": frameRate, "meanDb": meanDb, "threshold": threshold, "startTime": np.nan if isSilent else startTime, "endTime": np.nan if isSilent else endTime, "isSilent": isSilent}
 
-        if not isSilent:
-
-            plt.axhline(y=meanDb, xmin=0, xmax=1, color="gray", linewidth=2)
-            plt.axhline(y=threshold, xmin=0, xmax=1, color="pink", linewidth=2)
-            plt.axvline(ymin=0, ymax=1, x=startTime, color="green", linewidth=2)
-            plt.axvline(ymin=0, ymax=1, x=endTime, color="yellow", linewidth=2)
-
-        plt.legend()
-        plt.savefig(figName)
-        # plt.show()
+    if figName != "":
+        with timing.stage("figure"):
+            figure.drawSma(figName, **plotData)
 
-        # ■■■ 追加 ■■■
-        plt.cla()
-        plt.clf()
-        plt.close()
-        gc.collect()
+    # returnPlot=Trueなら描画用の配列も返す（描画は呼び出し側で後から行う）
+    if returnPlot:
+        return startTime, endTime, interval, plotData
 
     return startTime, endTime, interval
 
 
 if __name__ == "__main__":
 
+    # リポジトリのフォルダで python -m scripts.sma <wav> <fig.png> <thresholdRate> として実行する
     import sys
 
     fileName = sys.argv[1]
     figName = sys.argv[2]
-    thresholdRate = sys.argv[3]
+    thresholdRate = float(sys.argv[3])
 
     startTime, endTime, interval = run(fileName=fileName, figName=figName, thresholdRate=thresholdRate)
 
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# 起動を速くするための遅延import
+# BAT.pyは解析・描画・Excel・録音のモジュールを lazyImport() で持ち、最初に使うときに読み込む。
+# タイトル画面を出した後は warmUp() で裏で読み込んでおき、テスト開始時に待たないようにする。
+# python -m scripts.startup で BAT.py のimport時間が予算内か、重いモジュールを起動時に読み込んでいないかを確かめる。
+# 実行ファイルにしたら BAT --check-modules で遅延importするモジュールが含まれているかを確かめる。
+
+import os
+import sys
+import argparse
+import importlib
+import threading
+import subprocess
+
+
+# 起動時に読み込んではいけないモジュール
+HEAVY_MODULES = ["matplotlib", "scipy", "python_speech_features", "openpyxl", "pyaudio"]
+
+# タイトル画面の後に裏で読み込むモジュール
+WARM_UP_MODULES = ["scripts.record", "scripts.stream", "scripts.analyze"]
+
+# BAT.pyのimportにかけてよい時間（秒）
+IMPORT_BUDGET = 1.0
+
+
+class LazyModule:
+
+    # 属性に初めて触れたときにモジュールを読み込む
+    def __init__(self, name):
+
+        self.__dict__["name"] = name
+        self.__dict__["module"] = None
+
+    def load(self):
+
+        # 同時に読み込まれてもimportlibのロックで一度だけ実行される
+        if self.module is None:
+            self.__dict__["module"] = importlib.import_module(self.name)
+
+        return self.module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.load(), attr, value)
+
+def lazyImport(name):
+    return LazyModule(name)
+
+def warmUp(names=WARM_UP_MODULES, onError=None):
+
+    # 裏のスレッドで順に読み込む（GUIのスレッドは止めない）
+    # 読み込めなかったモジュールは onError(name, error) で知らせる（テストの途中で初めて失敗しないように）
+    def load():
+        for name in names:
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                if onError is not None:
+                    onError(name, e)
+
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+
+    return thread
+
+def checkModules(names=WARM_UP_MODULES):
+
+    # 実行ファイルに遅延importするモジュールが含まれているかを確かめる（BAT --check-modules）
+    isOk = True
+
+    for name in names:
+        try:
+            importlib.import_module(name)
+            print("ok: %s" % name)
+        except ImportError as e:
+            print("missing: %s (%s)" % (name, e))
+            isOk = False
+
+    return isOk
+
+def measureImport(moduleName="BAT", python=sys.executable):
+
+    # 新しいプロセスで python -X importtime を実行し、{"seconds": 合計時間, "modules": 読み込まれたモジュール} を返す
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    completed = subprocess.run([python, "-X", "importtime", "-c", "import %s" % moduleName], cwd=root, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    # scripts.analyze なら scripts と scripts.analyze の行を足す
+    parts = moduleName.split(".")
+    names = {".".join(parts[:i + 1]) for i in range(len(parts))}
+
+    seconds = 0.0
+    modules = set()
+
+    # import time: self [us] | cumulative | imported package
+    for line in completed.stderr.splitlines():
+
+        if not line.startswith("import time:"):
+            continue
+
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+
+        # 入れ子のimportは字下げされている
+        name = fields[2][1:].rstrip()
+        modules.add(name.strip())
+
+        if name in names:
+            seconds += int(fields[1]) / 1e6
+
+    return {"seconds": seconds, "modules": modules}
+
+def check(moduleName="BAT", budget=IMPORT_BUDGET, repeat=3):
+
+    # 一番速かった回で予算と比べる（ディスクキャッシュなどのばらつきを除く）
+    reports = [measureImport(moduleName) for i in range(repeat)]
+    seconds = min(report["seconds"] for report in reports)
+
+    loaded = sorted(name for name in reports[0]["modules"] if name in HEAVY_MODULES)
+
+    print("import %s: %.3f s (budget %.3f s)" % (moduleName, seconds, budget))
+    for name in loaded:
+        print("  heavy module loaded at startup: %s" % name)
+
+    return seconds <= budget and len(loaded) == 0
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Check that BAT.py starts within the import-time budget without loading the analysis stack.")
+    parser.add_argument("--module", default="BAT")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET, help="seconds")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sys.exit(0 if check(moduleName=args.module, budget=args.budget, repeat=args.repeat) else 1)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# 解析結果のSQLiteストア
+# セッションごとに result.xlsx の隣に results.sqlite を書き、
+# 全セッションの集計はログフォルダの results_index.sqlite にまとめてから検索する（変わったセッションだけ取り込み直す）
+# python -m scripts.store ~/Documents/log --user 山田 --method Mix
+
+import os
+import re
+import csv
+import json
+import glob
+import sqlite3
+import datetime
+
+
+STORE_NAME = "results.sqlite"
+INDEX_NAME = "results_index.sqlite"
+
+# BAT_Ver0.9.6_<user>_<2020.01.01_00.00.00>
+SESSION_NAME_PATTERN = re.compile(r"^BAT_Ver(?P<version>[^_]+)_(?P<user>.*)_(?P<date>\d{4}\.\d{2}\.\d{2}_\d{2}\.\d{2}\.\d{2})$")
+
+COLUMNS = ["session", "version", "user", "date", "mode", "itemIndex", "read", "method", "startTime", "endTime", "interval", "isInputLow", "params", "analyzedAt"]
+
+CREATE_RESULTS = """
+CREATE TABLE IF NOT EXISTS results (
+    session TEXT NOT NULL,
+    version TEXT,
+    user TEXT,
+    date TEXT,
+    mode TEXT NOT NULL,
+    itemIndex INTEGER NOT NULL,
+    read TEXT,
+    method TEXT NOT NULL,
+    startTime REAL,
+    endTime REAL,
+    interval REAL,
+    isInputLow INTEGER NOT NULL,
+    params TEXT,
+    analyzedAt TEXT,
+    PRIMARY KEY (session, mode, itemIndex, method)
+)
+"""
+
+CREATE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS resultsByUser ON results (user, mode, method)",
+    "CREATE INDEX IF NOT EXISTS resultsByMethod ON results (method, mode)",
+]
+
+# 再解析を省くためのマニフェスト（wavの状態・解析方法・パラメータと、その時の結果）
+MANIFEST_COLUMNS = ["wavName", "method", "size", "mtime", "hash", "params", "startTime", "endTime", "interval", "isInputLow"]
+
+CREATE_MANIFEST = """
+CREATE TABLE IF NOT EXISTS manifest (
+    wavName TEXT NOT NULL,
+    method TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    params TEXT NOT NULL,
+    startTime REAL,
+    endTime REAL,
+    interval REAL,
+    isInputLow INTEGER NOT NULL,
+    PRIMARY KEY (wavName, method)
+)
+"""
+
+# 刺激を表示した時刻と、録音の最初のサンプルの時刻（どちらもtime.perf_counter()）
+# offset = stimulusAt - firstFrameAt を解析結果の時刻から引くと刺激の表示からの時刻になる
+ALIGNMENT_COLUMNS = ["wavName", "stimulusAt", "firstFrameAt", "offset"]
+
+CREATE_ALIGNMENT = """
+CREATE TABLE IF NOT EXISTS alignment (
+    wavName TEXT PRIMARY KEY,
+    stimulusAt REAL NOT NULL,
+    firstFrameAt REAL NOT NULL,
+    offset REAL NOT NULL
+)
+"""
+
+CREATE_SESSIONS = """
+CREATE TABLE IF NOT EXISTS sessions (
+    path TEXT PRIMARY KEY,
+    session TEXT NOT NULL,
+    mtime INTEGER NOT NULL
+)
+"""
+
+
+def parseSessionName(logDir):
+
+    # フォルダ名が BAT_Ver* の形でなければ None
+    match = SESSION_NAME_PATTERN.match(os.path.basename(os.path.normpath(logDir)))
+
+    if match is None:
+        return None
+
+    return match.groupdict()
+
+def storePathOf(logDir):
+    return os.path.join(logDir, STORE_NAME)
+
+def connect(path):
+
+    conn = sqlite3.connect(path)
+    conn.execute(CREATE_RESULTS)
+    for statement in CREATE_INDEXES:
+        conn.execute(statement)
+
+    return conn
+
+def writeSession(logDir, mode, analyzeMethod, items, results, params=None):
+
+    # items は [(出題順, 読み), ...]、results は [(startTime, endTime, interval), ...]
+    session = os.path.basename(os.path.normpath(logDir))
+    info = parseSessionName(logDir) or {"version": None, "user": None, "date": None}
+
+    paramsText = json.dumps(params, sort_keys=True, ensure_ascii=False) if params is not None else None
+    analyzedAt = datetime.datetime.now().isoformat(timespec="seconds")
+
+    rows = []
+    for (itemIndex, read), (startTime, endTime, interval) in zip(items, results):
+
+        # "Input Low" は時刻を持たない
+        isInputLow = "Input Low" in (startTime, endTime, interval)
+        if isInputLow:
+            startTime = endTime = interval = None
+
+        rows.append((session, info["version"], info["user"], info["date"], mode.lower(), itemIndex, read, analyzeMethod, startTime, endTime, interval, int(isInputLow), paramsText, analyzedAt))
+
+    conn = connect(storePathOf(logDir))
+    try:
+        with conn:
+            # 同じテスト・解析方法の結果は置き換える
+            conn.execute("DELETE FROM results WHERE mode = ? AND method = ?", (mode.lower(), analyzeMethod))
+            conn.executemany("INSERT INTO results VALUES (%s)" % ", ".join(["?"] * len(COLUMNS)), rows)
+    finally:
+        conn.close()
+
+def readManifest(logDir, analyzeMethod):
+
+    # {wavName: {列名: 値}}（"Input Low"の結果は文字列に戻す）
+    path = storePathOf(logDir)
+    if not os.path.isfile(path):
+        return {}
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(CREATE_MANIFEST)
+        rows = conn.execute("SELECT %s FROM manifest WHERE method = ?" % ", ".join(MANIFEST_COLUMNS), (analyzeMethod,)).fetchall()
+    finally:
+        conn.close()
+
+    manifest = {}
+    for row in rows:
+
+        entry = dict(zip(MANIFEST_COLUMNS, row))
+        if entry["isInputLow"]:
+            entry["startTime"] = entry["endTime"] = entry["interval"] = "Input Low"
+
+        manifest[entry["wavName"]] = entry
+
+    return manifest
+
+def writeManifest(logDir, analyzeMethod, entries):
+
+    # entries は [{wavName, size, mtime, hash, params, result}, ...]
+    rows = []
+    for entry in entries:
+
+        startTime, endTime, interval = entry["result"]
+
+        isInputLow = "Input Low" in (startTime, endTime, interval)
+        if isInputLow:
+            startTime = endTime = interval = None
+
+        rows.append((entry["wavName"], analyzeMethod, entry["size"], entry["mtime"], entry["hash"], entry["params"], startTime, endTime, interval, int(isInputLow)))
+
+    conn = connect(storePathOf(logDir))
+    try:
+        conn.execute(CREATE_MANIFEST)
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO manifest VALUES (%s)" % ", ".join(["?"] * len(MANIFEST_COLUMNS)), rows)
+    finally:
+        conn.close()
+
+def readAlignment(logDir):
+
+    # {wavName: offset}
+    path = storePathOf(logDir)
+    if not os.path.isfile(path):
+        return {}
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(CREATE_ALIGNMENT)
+        rows = conn.execute("SELECT wavName, offset FROM alignment").fetchall()
+    finally:
+        conn.close()
+
+    return dict(rows)
+
+def writeAlignment(logDir, wavName, stimulusAt, firstFrameAt):
+
+    conn = connect(storePathOf(logDir))
+    try:
+        conn.execute(CREATE_ALIGNMENT)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO alignment VALUES (?, ?, ?, ?)", (wavName, stimulusAt, firstFrameAt, stimulusAt - firstFrameAt))
+    finally:
+        conn.close()
+
+def buildIndex(logRoot):
+
+    # 各セッションのresults.sqliteを一つにまとめる（前回から更新されたものだけ取り込み直す）
+    indexPath = os.path.join(logRoot, INDEX_NAME)
+
+    conn = connect(indexPath)
+    conn.execute(CREATE_SESSIONS)
+
+    try:
+        known = {path: (session, mtime) for path, session, mtime in conn.execute("SELECT path, session, mtime FROM sessions")}
+        found = set()
+
+        for path in glob.glob(os.path.join(logRoot, "**", STORE_NAME), recursive=True):
+
+            path = os.path.normpath(path)
+            found.add(path)
+
+            # 同じ名前のセッションが別のフォルダにあっても混ざらないように、logRootからの相対パスで区別する
+            session = os.path.relpath(os.path.dirname(path), logRoot).replace(os.sep, "/")
+
+            mtime = os.stat(path).st_mtime_ns
+            if known.get(path) == (session, mtime):
+                continue
+
+            # 以前の名前で取り込んだ行も消す
+            staleSession = known[path][0] if path in known else session
+
+            # ATTACHはトランザクションの外で行う
+            conn.execute("ATTACH DATABASE ? AS part", (path,))
+            try:
+                with conn:
+                    conn.execute("DELETE FROM results WHERE session IN (?, ?)", (session, staleSession))
+                    conn.execute("INSERT OR REPLACE INTO results SELECT ?, %s FROM part.results" % ", ".join(COLUMNS[1:]), (session,))
+                    conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (path, session, mtime))
+            finally:
+                conn.execute("DETACH DATABASE part")
+
+        # 消えたセッション
+        with conn:
+            for path in set(known) - found:
+                session, = conn.execute("SELECT session FROM sessions WHERE path = ?", (path,)).fetchone()
+                conn.execute("DELETE FROM results WHERE session = ?", (session,))
+                conn.execute("DELETE FROM sessions WHERE path = ?", (path,))
+    finally:
+        conn.close()
+
+    return indexPath
+
+def query(logRoot, refresh=True, **conditions):
+
+    # query(logRoot, user="山田", mode="test2", method="Mix") => [{列名: 値}, ...]
+    indexPath = buildIndex(logRoot) if refresh else os.path.join(logRoot, INDEX_NAME)
+
+    for key in conditions:
+        if key not in COLUMNS:
+            raise ValueError("Unknown column: %s" % key)
+
+    where = " AND ".join("%s = ?" % key for key in conditions)
+    sql = "SELECT %s FROM results%s ORDER BY session, mode, itemIndex, method" % (", ".join(COLUMNS), " WHERE " + where if where else "")
+
+    conn = sqlite3.connect(indexPath)
+    try:
+        rows = conn.execute(sql, list(conditions.values())).fetchall()
+    finally:
+        conn.close()
+
+    return [dict(zip(COLUMNS, row)) for row in rows]
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query the analysis results of every session under a log directory.")
+    parser.add_argument("logRoot")
+    parser.add_argument("--session", help="session folder relative to logRoot")
+    parser.add_argument("--user")
+    parser.add_argument("--mode", help="test1 / test2 / test3")
+    parser.add_argument("--method")
+    parser.add_argument("--csv", default=None, help="write the rows to a csv instead of printing a count")
+    args = parser.parse_args()
+
+    conditions = {key: value for key, value in [("session", args.session), ("user", args.user), ("mode", args.mode), ("method", args.method)] if value is not None}
+    rows = query(args.logRoot, **conditions)
+
+    if args.csv is None:
+        print("%d rows" % len(rows))
+    else:
+        with open(args.csv, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+        print("Wrote %s" % args.csv)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# 長時間録音向けの逐次（ブロック単位）解析
+# ファイル全体を読み込まず、固定長ブロックごとに移動平均と閾値判定の状態を引き継ぐ
+
+import math
+
+import numpy as np
+import python_speech_features as psf
+
+from scripts import audio, average, mix
+
+
+DEFAULT_BLOCK_SIZE = 2**15
+
+
+def decodeFrames(data):
+    return np.frombuffer(data, dtype="int16") / audio.LEGACY_SCALE
+
+def readBlocks(fileName, blockSize=DEFAULT_BLOCK_SIZE):
+
+    # メモリマップしたPCMからブロックごとに変換する
+    wav = audio.WavFile(fileName)
+
+    return wav.frameRate, wav.nFrames, wav.blocks(blockSize, dtype=np.float64, scale=audio.LEGACY_SCALE)
+
+
+class ThresholdTracker:
+
+    # 閾値（最大値 * thresholdRate）を初めて超えた位置と最後に超えた位置を
+    # 全データを保持せずに追跡する
+    def __init__(self, thresholdRate):
+
+        self.thresholdRate = thresholdRate
+        self.maxValue = -np.inf
+        self.count = 0
+
+        # 開始候補：それまでの最大値を更新した点（値は単調増加）
+        self.startIdxs = np.zeros(0, dtype=np.int64)
+        self.startValues = np.zeros(0)
+
+        # 終了候補：それ以降のどの値よりも大きい点（値は単調減少）
+        self.endIdxs = np.zeros(0, dtype=np.int64)
+        self.endValues = np.zeros(0)
+
+    def threshold(self):
+        return self.maxValue * self.thresholdRate
+
+    def push(self, values):
+
+        if len(values) == 0:
+            return
+
+        idxs = np.arange(self.count, self.count + len(values))
+
+        prevMaxs = np.maximum.accumulate(np.concatenate(([self.maxValue], values)))[:-1]
+        isRecord = values > prevMaxs
+        self.startIdxs = np.concatenate((self.startIdxs, idxs[isRecord]))
+        self.startValues = np.concatenate((self.startValues, values[isRecord]))
+
+        laterMaxs = np.maximum.accumulate(values[::-1])[::-1]
+        isRecord = values > np.concatenate((laterMaxs[1:], [-np.inf]))
+        isAlive = self.endValues > laterMaxs[0]
+        self.endIdxs = np.concatenate((self.endIdxs[isAlive], idxs[isRecord]))
+        self.endValues = np.concatenate((self.endValues[isAlive], values[isRecord]))
+
+        self.maxValue = max(self.maxValue, laterMaxs[0])
+        self.count += len(values)
+
+        # 閾値は上がる一方なので、現在の閾値以下の候補は二度と答えにならない
+        threshold = self.threshold()
+
+        isAlive = self.startValues > threshold
+        self.startIdxs = self.startIdxs[isAlive]
+        self.startValues = self.startValues[isAlive]
+
+        isAlive = self.endValues > threshold
+        self.endIdxs = self.endIdxs[isAlive]
+        self.endValues = self.endValues[isAlive]
+
+    def edges(self):
+
+        if len(self.startIdxs) == 0:
+            return None
+
+        return int(self.startIdxs[0]), int(self.endIdxs[-1])
+
+
+class OnsetDetector:
+
+    def __init__(self, frameRate, thresholdRate=0.1, windowSize=100):
+
+        self.frameRate = frameRate
+
+        self.movingAverage = average.MovingAverage(window=windowSize)
+        self.tracker = ThresholdTracker(thresholdRate=thresholdRate)
+
+        self.powerSum = 0.0
+        self.sampleCount = 0
+
+    # datasは移動平均をとる系列、powersは平均音量の計算に使う信号のパワー
+    def push(self, datas, powers=None):
+
+        if powers is None:
+            powers = datas
+
+        self.powerSum += np.sum(powers)
+        self.sampleCount += len(powers)
+
+        self.tracker.push(self.movingAverage.push(datas))
+
+        return self.times()
+
+    def times(self):
+
+        edges = self.tracker.edges()
+        if edges is None:
+            return None
+
+        startTime = edges[0] / self.frameRate
+        endTime = edges[1] / self.frameRate
+        interval = endTime - startTime
+
+        return startTime, endTime, interval
+
+    def finish(self, minNoiseLevel=1.0):
+
+        self.tracker.push(self.movingAverage.flush())
+
+        # 平均音量（db）
+        meanDb = 10 * np.log10(self.powerSum / self.sampleCount)
+
+        if meanDb < minNoiseLevel:
+            return "Input Low", "Input Low", "Input Low"
+
+        return self.times()
+
+
+def getMfcc(fileName, blockSize=DEFAULT_BLOCK_SIZE, winlen=0.025, winstep=0.01, preemph=0.97):
+
+    # psf.mfccと同じフレームをブロックごとに計算する
+    frameRate, nFrames, blocks = readBlocks(fileName=fileName, blockSize=blockSize)
+
+    frameLen = int(psf.sigproc.round_half_up(winlen * frameRate))
+    frameStep = int(psf.sigproc.round_half_up(winstep * frameRate))
+
+    if nFrames <= frameLen:
+        numFrames = 1
+    else:
+        numFrames = 1 + int(math.ceil((1.0 * nFrames - frameLen) / frameStep))
+
+    mfccs = []
+    doneFrames = 0
+    buffer = np.zeros(0)
+    lastSample = None
+
+    for wavs in blocks:
+
+        # プリエンファシスはブロック境界をまたぐので自前で行う
+        if lastSample is None:
+            emphasized = np.append(wavs[0], wavs[1:] - preemph * wavs[:-1])
+        else:
+            emphasized = wavs - preemph * np.append(lastSample, wavs[:-1])
+        lastSample = wavs[-1]
+
+        buffer = np.concatenate((buffer, emphasized))
+
+        if len(buffer) >= frameLen:
+
+            count = 1 + (len(buffer) - frameLen) // frameStep
+            mfccs.append(psf.mfcc(buffer[:(count - 1) * frameStep + frameLen], frameRate, winlen=winlen, winstep=winstep, preemph=0))
+
+            buffer = buffer[count * frameStep:]
+            doneFrames += count
+
+    # 末尾の0詰めフレーム
+    if numFrames > doneFrames and len(buffer) > 0:
+        mfccs.append(psf.mfcc(buffer, frameRate, winlen=winlen, winstep=winstep, preemph=0))
+
+    mfccs = np.concatenate(mfccs)
+    deltas = psf.delta(mfccs, 2)
+
+    return np.c_[mfccs, deltas], frameRate, nFrames
+
+
+def runSma(fileName, thresholdRate=0.1, windowSize=100, minNoiseLevel=1.0, blockSize=DEFAULT_BLOCK_SIZE, callback=None):
+
+    frameRate, nFrames, blocks = readBlocks(fileName=fileName, blockSize=blockSize)
+    detector = OnsetDetector(frameRate=frameRate, thresholdRate=thresholdRate, windowSize=windowSize)
+
+    for wavs in blocks:
+
+        times = detector.push(wavs ** 2) # 信号のパワー
+
+        # 暫定の開始・終了時刻を逐次通知する
+        if callback is not None and times is not None:
+            callback(*times)
+
+    return detector.finish(minNoiseLevel=minNoiseLevel)
+
+
+def runMix(fileName, smaThresholdRate=0.1, smaWindowSize=100, minNoiseLevel=1.0, engine="exact", blockSize=DEFAULT_BLOCK_SIZE, callback=None):
+
+    # 1パス目：フレーム単位の特徴量（サンプル数の1/160程度）だけを保持する
+    mfccs, frameRate, nFrames = getMfcc(fileName=fileName, blockSize=blockSize)
+
+    dataLength = len(mfccs)
+    y_observed = mix.getVadFluctuation(mfccs[:, 0], mfccs[:, 13])
+    # 逐次解析ではフレーム単位の検出（"frame"）は行わず、同じスプラインで補間する
+    fitted_curve = mix.fitEnvelope(y_observed, engine="exact" if engine == "exact" else "fast")
+
+    # np.linspace(0, dataLength - 1, nFrames) の該当区間をブロックごとに作る
+    step = (dataLength - 1) / (nFrames - 1)
+
+    # 2パス目：サンプル単位のパワーに包絡線を掛けて逐次判定する
+    frameRate, nFrames, blocks = readBlocks(fileName=fileName, blockSize=blockSize)
+    detector = OnsetDetector(frameRate=frameRate, thresholdRate=smaThresholdRate, windowSize=smaWindowSize)
+
+    offset = 0
+    for wavs in blocks:
+
+        x_latents = np.arange(offset, offset + len(wavs)) * step
+        offset += len(wavs)
+
+        if offset == nFrames:
+            x_latents[-1] = dataLength - 1
+
+        powers = wavs ** 2 # 信号のパワー
+        times = detector.push(fitted_curve(x_latents) * powers, powers)
+
+        if callback is not None and times is not None:
+            callback(*times)
+
+    return detector.finish(minNoiseLevel=minNoiseLevel)
+
+
+if __name__ == "__main__":
+
+    import sys
+
+    fileName = sys.argv[1]
+
+    startTime, endTime, interval = runMix(fileName=fileName, callback=lambda *times: print("%f,%f,%f" % times))
+
+    print("%s,%s,%s" % (startTime, endTime, interval))
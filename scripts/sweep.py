@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# 閾値・窓幅のスイープ
+# ファイルごとにパワー・SMA・VADの包絡線を一度だけ計算し、閾値の組み合わせ全体をまとめて判定する
+# python -m scripts.sweep ~/Documents/log --method Mix --sma-window-sizes 50,100,200 --sma-threshold-rates 0.05,0.1,0.2
+
+import os
+import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from scripts import sma, mfcc, mix, average, cache, analyze
+
+
+SWEEP_HEADER = ["fileName", "method", "smaWindowSize", "smaThresholdRate", "minNoiseLevel", "mfccThreshold", "startTime", "endTime", "interval"]
+
+
+def firstAndLastAbove(values, thresholds, inclusive=False):
+
+    # 各閾値について values > threshold（inclusiveなら >=）となる最初と最後の位置
+    # 先頭からの最大値・末尾からの最大値は単調なので、二分探索でまとめて求められる
+    prefixMaxs = np.maximum.accumulate(values)
+    suffixMaxs = np.maximum.accumulate(values[::-1])[::-1]
+
+    side = "left" if inclusive else "right"
+    starts = np.searchsorted(prefixMaxs, thresholds, side=side)
+    ends = np.searchsorted(-suffixMaxs, -thresholds, side="right" if inclusive else "left") - 1
+
+    isFound = starts < len(values)
+
+    return starts, ends, isFound
+
+def sweepSmas(datas, frameRate, meanDb, windowSizes, thresholdRates, minNoiseLevels):
+
+    rows = []
+    thresholdRates = np.asarray(thresholdRates, dtype=float)
+
+    # 累積和は一度だけ取り、窓幅ごとの移動平均はその差分で求める（窓幅によらずO(n)）
+    runningSum = average.RunningSum(datas)
+
+    for windowSize in windowSizes:
+
+        smas = runningSum.average(windowSize)
+        starts, ends, isFound = firstAndLastAbove(smas, np.max(smas) * thresholdRates)
+
+        for thresholdRate, predStart, predEnd, found in zip(thresholdRates, starts, ends, isFound):
+            for minNoiseLevel in minNoiseLevels:
+
+                if meanDb < minNoiseLevel or not found:
+                    times = ("Input Low", "Input Low", "Input Low")
+                else:
+                    startTime = predStart / frameRate
+                    endTime = predEnd / frameRate
+                    times = (startTime, endTime, endTime - startTime)
+
+                rows.append((windowSize, float(thresholdRate), minNoiseLevel, None) + times)
+
+    return rows
+
+def sweepFile(fileName, analyzeMethod, smaWindowSizes, smaThresholdRates, minNoiseLevels, mfccThresholds, mixEngine="exact", useFeatureCache=False):
+
+    if useFeatureCache:
+        featureCache = cache.FeatureCache(cacheDir=cache.cacheDirOf(fileName))
+    else:
+        featureCache = None
+
+    if analyzeMethod == "SMA":
+
+        wavs, frameRate = sma.ReadWavFile(fileName=fileName)
+        powers = wavs ** 2 # 信号のパワー
+
+        meanDb = 10 * np.log10(np.mean(powers))
+        rows = sweepSmas(powers, frameRate, meanDb, smaWindowSizes, smaThresholdRates, minNoiseLevels)
+
+    elif analyzeMethod == "Mix":
+
+        wavs, frameRate = mix.ReadWavFile(fileName=fileName)
+        powers = wavs ** 2 # 信号のパワー
+
+        if featureCache is None:
+            mfccs = mix.getMfcc(wavs, frameRate)
+        else:
+            mfccs = featureCache.getOrCompute(fileName, mix.mfccParamsOf(np.float64), lambda: mix.getMfcc(wavs, frameRate))
+
+        # 閾値によらない包絡線は一度だけ計算する（"frame"はサンプル単位の包絡線を作らないので"fast"で代用）
+        envelopes = mix.getVadFluctuation(mfccs[:, 0], mfccs[:, 13])
+        vads = mix.upsampleEnvelope(envelopes, len(powers), engine="exact" if mixEngine == "exact" else "fast") * powers
+
+        meanDb = 10 * np.log10(np.mean(powers))
+        rows = sweepSmas(vads, frameRate, meanDb, smaWindowSizes, smaThresholdRates, minNoiseLevels)
+
+    elif analyzeMethod == "MFCC":
+
+        if featureCache is None:
+            mfccs = mfcc.getMfcc(fileName)
+        else:
+            mfccs = featureCache.getOrCompute(fileName, mfcc.MFCC_PARAMS, lambda: mfcc.getMfcc(fileName))
+
+        vad, vadPeekMin, vadPeekMax = mfcc.getVadFluctuation(mfccs[:, 0], mfccs[:, 13])
+
+        # mfcc.runと同じく vad >= 閾値 を発話区間とする
+        mfccThresholds = np.asarray(mfccThresholds, dtype=float)
+        starts, ends, isFound = firstAndLastAbove(vad, mfccThresholds, inclusive=True)
+
+        rows = []
+        for mfccThreshold, predStart, predEnd, found in zip(mfccThresholds, starts, ends, isFound):
+
+            if not found:
+                times = ("Input Low", "Input Low", "Input Low")
+            else:
+                startTime = predStart / 100.0
+                endTime = predEnd / 100.0
+                times = (startTime, endTime, endTime - startTime)
+
+            rows.append((None, None, None, float(mfccThreshold)) + times)
+
+    else:
+        raise ValueError("Unknown analyze method: %s" % analyzeMethod)
+
+    return [(fileName, analyzeMethod) + row for row in rows]
+
+def sweepFiles(fileNames, analyzeMethod, smaWindowSizes, smaThresholdRates, minNoiseLevels, mfccThresholds, mixEngine="exact", useFeatureCache=False, maxWorkers=None):
+
+    rows = []
+
+    with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+
+        futures = [executor.submit(sweepFile, fileName, analyzeMethod, smaWindowSizes, smaThresholdRates, minNoiseLevels, mfccThresholds, mixEngine, useFeatureCache) for fileName in fileNames]
+
+        for future in futures:
+            rows.extend(future.result())
+
+    return rows
+
+def writeTable(filePath, rows):
+
+    with open(filePath, "w", newline="", encoding="utf-8-sig") as f:
+
+        writer = csv.writer(f)
+        writer.writerow(SWEEP_HEADER)
+        writer.writerows(rows)
+
+def parseValues(text, valueType=float):
+
+    # "0.05,0.1,0.2" または "開始:終了:刻み"（終了を含む）
+    if ":" in text:
+        start, stop, step = [float(value) for value in text.split(":")]
+        return [valueType(value) for value in np.arange(start, stop + step * 0.5, step)]
+
+    return [valueType(value) for value in text.split(",")]
+
+
+if __name__ == "__main__":
+
+    from scripts import batch
+
+    parser = argparse.ArgumentParser(description="Evaluate a grid of thresholds over every BAT session under a log directory.")
+    parser.add_argument("logRoot")
+    parser.add_argument("--method", default="Mix", choices=list(analyze.FIG_SUFFIXES.keys()))
+    parser.add_argument("--mode", action="append", choices=batch.MODES, help="test to sweep (repeatable, default: all)")
+    parser.add_argument("--sma-window-sizes", default=str(analyze.SMA_WINDOW_SIZE))
+    parser.add_argument("--sma-threshold-rates", default=str(analyze.SMA_THRESHOLD_RATE))
+    parser.add_argument("--min-noise-levels", default=str(analyze.MIN_NOISE_LEVEL))
+    parser.add_argument("--mfcc-thresholds", default=str(analyze.MFCC_THRESHOLD))
+    parser.add_argument("--mix-engine", default=analyze.MIX_ENGINE, choices=["exact", "fast", "frame"])
+    parser.add_argument("--no-feature-cache", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=None, help="sweep table csv (default: <logRoot>/sweep.csv)")
+    args = parser.parse_args()
+
+    fileNames = []
+    for logDir, info in batch.findSessions(args.logRoot):
+        for mode in args.mode or batch.MODES:
+            fileNames.extend(analyze.listWavPaths(wavDirPath="%s/wavs" % logDir, mode=mode))
+
+    rows = sweepFiles(fileNames=fileNames, analyzeMethod=args.method,
+                      smaWindowSizes=parseValues(args.sma_window_sizes, int),
+                      smaThresholdRates=parseValues(args.sma_threshold_rates),
+                      minNoiseLevels=parseValues(args.min_noise_levels),
+                      mfccThresholds=parseValues(args.mfcc_thresholds),
+                      mixEngine=args.mix_engine, useFeatureCache=not args.no_feature_cache, maxWorkers=args.workers)
+
+    output = args.output or os.path.join(args.logRoot, "sweep.csv")
+    writeTable(output, rows)
+
+    print("Wrote %d rows to %s" % (len(rows), output))
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# 解析の段階ごとの時間計測
+# 各解析のrun()の中は timing.stage("mfcc") のように区切ってあり、計測中でなければ何もしない。
+# セッションごとの結果は result.xlsx の隣の timing_<mode>.csv に書き、全セッションの集計は
+# python -m scripts.timing ~/Documents/log で見る。
+
+import sys
+import csv
+import glob
+import time
+import contextlib
+import tracemalloc
+
+
+TIMING_HEADER = ["fileName", "stage", "wallTime", "cpuTime", "allocatedBlocks", "peakBytes"]
+
+NULL_STAGE = contextlib.nullcontext()
+
+
+class Profiler:
+
+    # traceMemory=Trueなら段階ごとのメモリのピーク（tracemalloc）も測る（遅くなる）
+    def __init__(self, traceMemory=False):
+
+        self.records = []
+        self.fileName = ""
+        self.traceMemory = traceMemory
+
+        # 入れ子のstageでピークをリセットしても外側のピークが分かるように、内側のピークを外側へ伝える
+        self.childPeaks = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+
+        isTracing = self.traceMemory and tracemalloc.is_tracing()
+        if isTracing:
+            tracemalloc.reset_peak()
+            self.childPeaks.append(0)
+
+        blocks = sys.getallocatedblocks()
+        wallStart = time.perf_counter()
+        cpuStart = time.process_time()
+
+        try:
+            yield
+        finally:
+            peakBytes = None
+            if isTracing:
+                peakBytes = max(tracemalloc.get_traced_memory()[1], self.childPeaks.pop())
+                if len(self.childPeaks) > 0:
+                    self.childPeaks[-1] = max(self.childPeaks[-1], peakBytes)
+
+            record = {
+                "fileName": self.fileName,
+                "stage": name,
+                "wallTime": time.perf_counter() - wallStart,
+                "cpuTime": time.process_time() - cpuStart,
+                # 段階の前後で増えたPythonのメモリブロック数（numpyの配列本体は含まない）
+                "allocatedBlocks": sys.getallocatedblocks() - blocks,
+                "peakBytes": peakBytes,
+            }
+            self.records.append(record)
+
+    def extend(self, records):
+        self.records.extend(records)
+
+    def write(self, filePath, records=None):
+
+        with open(filePath, "w", newline="", encoding="utf-8-sig") as f:
+
+            writer = csv.DictWriter(f, fieldnames=TIMING_HEADER)
+            writer.writeheader()
+            writer.writerows(self.records if records is None else records)
+
+
+activeProfiler = None
+
+def stage(name):
+
+    # 計測中でなければ何もしない
+    if activeProfiler is None:
+        return NULL_STAGE
+
+    return activeProfiler.stage(name)
+
+@contextlib.contextmanager
+def profiling(profiler, fileName=""):
+
+    # この中で呼ばれたstage()をprofilerに記録する（profilerがNoneなら何もしない）
+    global activeProfiler
+
+    if profiler is None:
+        yield None
+        return
+
+    previous = activeProfiler, profiler.fileName
+    activeProfiler = profiler
+    profiler.fileName = fileName
+
+    isStarted = profiler.traceMemory and not tracemalloc.is_tracing()
+    if isStarted:
+        tracemalloc.start()
+
+    try:
+        yield profiler
+    finally:
+        if isStarted:
+            tracemalloc.stop()
+
+        activeProfiler, profiler.fileName = previous
+
+def readRecords(filePath):
+
+    records = []
+
+    with open(filePath, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+
+            row["wallTime"] = float(row["wallTime"])
+            row["cpuTime"] = float(row["cpuTime"])
+            row["allocatedBlocks"] = int(row["allocatedBlocks"])
+            row["peakBytes"] = int(row["peakBytes"]) if row["peakBytes"] else None
+            records.append(row)
+
+    return records
+
+def summarize(records):
+
+    # 段階ごとの合計・平均と、全体（"total"以外の合計）に占める割合
+    stages = {}
+
+    for record in records:
+
+        summary = stages.setdefault(record["stage"], {"stage": record["stage"], "count": 0, "wallTime": 0.0, "cpuTime": 0.0, "peakBytes": None})
+        summary["count"] += 1
+        summary["wallTime"] += record["wallTime"]
+        summary["cpuTime"] += record["cpuTime"]
+
+        if record["peakBytes"] is not None:
+            summary["peakBytes"] = max(summary["peakBytes"] or 0, record["peakBytes"])
+
+    totalWallTime = sum(summary["wallTime"] for name, summary in stages.items() if name != "total")
+
+    for summary in stages.values():
+        summary["meanWallTime"] = summary["wallTime"] / summary["count"]
+        summary["share"] = summary["wallTime"] / totalWallTime if totalWallTime > 0 and summary["stage"] != "total" else None
+
+    return sorted(stages.values(), key=lambda summary: -summary["wallTime"])
+
+def printSummary(summaries):
+
+    print("%-12s %6s %10s %10s %10s %6s" % ("stage", "count", "wall[s]", "cpu[s]", "mean[ms]", "share"))
+
+    for summary in summaries:
+        share = "%5.1f%%" % (summary["share"] * 100) if summary["share"] is not None else ""
+        print("%-12s %6d %10.3f %10.3f %10.2f %6s" % (summary["stage"], summary["count"], summary["wallTime"], summary["cpuTime"], summary["meanWallTime"] * 1000, share))
+
+
+if __name__ == "__main__":
+
+    # 全セッションの timing_*.csv を集計する
+    records = []
+    for logRoot in sys.argv[1:]:
+        for filePath in sorted(glob.glob("%s/**/timing_*.csv" % logRoot, recursive=True)):
+            records.extend(readRecords(filePath))
+
+    print("%d records" % len(records))
+    printSummary(summarize(records))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# float32で解析した開始・終了時刻がfloat64の結果と1サンプル（MFCCは1フレーム）以内で一致するかの回帰テスト
+# リポジトリのフォルダで python -m pytest tests として実行する
+
+import os
+import wave
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from scripts import analyze, average, mix, precision
+
+
+RATE = 16000
+
+
+def writeWav(fileName, pcm):
+
+    with wave.open(fileName, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(pcm.astype("<i2").tobytes())
+
+def makeSpeech(seconds, start, end, seed):
+
+    # 雑音の中に、振幅の揺れる発話らしい区間を置く
+    rng = np.random.default_rng(seed)
+    n = int(seconds * RATE)
+
+    pcm = rng.normal(0, 60, n)
+    t = np.arange(int(start * RATE), int(end * RATE))
+    pcm[t] += rng.normal(0, 3000, len(t)) * (1.2 + np.sin(2 * np.pi * 4 * t / RATE))
+
+    return np.clip(pcm, -32768, 32767)
+
+
+class PrecisionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.tempDir = tempfile.mkdtemp()
+        cls.fileNames = []
+
+        for i, (seconds, start, end) in enumerate([(3.0, 0.8, 2.1), (5.0, 1.5, 1.9), (4.0, 0.05, 3.9)]):
+            fileName = os.path.join(cls.tempDir, "test1_%d_a.wav" % i)
+            writeWav(fileName, makeSpeech(seconds, start, end, seed=i))
+            cls.fileNames.append(fileName)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tempDir)
+
+    def assertWithinOneStep(self, analyzeMethod, params):
+        self.assertEqual(precision.check(analyzeMethod, self.fileNames, params), [])
+
+    def testSma(self):
+        self.assertWithinOneStep("SMA", analyze.makeParams())
+
+    def testMix(self):
+        for engine in ["exact", "fast"]:
+            self.assertWithinOneStep("Mix", analyze.makeParams(mixEngine=engine))
+
+    def testFrameEngine(self):
+
+        # Mixの"frame"は"exact"と1サンプル以内
+        params = analyze.makeParams(mixEngine="exact")
+        self.assertEqual(precision.check("Mix", self.fileNames, params, variant={"mixEngine": "frame"}), [])
+
+    def testMfcc(self):
+        self.assertWithinOneStep("MFCC", analyze.makeParams())
+
+    def testMovingAverage(self):
+
+        # float32はブロックごとの累積和、float64は全体の累積和で、どちらもnp.convolveと同じ値
+        rng = np.random.default_rng(0)
+        datas = rng.random(3 * average.BLOCK_SIZE + 123)
+
+        for window in [1, 2, 100, 101]:
+            expected = np.convolve(datas, np.ones(window) / window, mode="same")
+            self.assertTrue(np.allclose(average.movingAverage(datas, window), expected))
+            self.assertTrue(np.allclose(average.movingAverage(datas.astype(np.float32), window), expected, rtol=1e-5))
+            self.assertEqual(average.movingAverage(datas.astype(np.float32), window).dtype, np.float32)
+
+    def testUpsampleEnvelope(self):
+
+        # ブロックごとに評価してもnp.linspaceで全サンプルを評価した値と同じ
+        envelopes = np.random.default_rng(1).random(300)
+
+        for engine in ["exact", "fast"]:
+            expected = mix.fitEnvelope(envelopes, engine=engine)(np.linspace(0, len(envelopes) - 1, 100000))
+            self.assertTrue(np.array_equal(mix.upsampleEnvelope(envelopes, 100000, engine=engine, blockSize=4096), expected))
+            self.assertEqual(mix.upsampleEnvelope(envelopes, 100000, engine=engine, dtype=np.float32).dtype, np.float32)
+
+
+if __name__ == "__main__":
+    unittest.main()